@@ -1,11 +1,62 @@
-from .alpha import move as alpha
-from .beta import move as beta
+'''
+    Registry of the bots. get_algorithm('zeta') gives the move function, a
+    bot module is only imported the first time it is used, so importing the
+    package is cheap. `algorithms.zeta` is the module itself (its knobs,
+    eg. algorithms.zeta.MAX_DEPTH, can be set); State and Problem are
+    imported on first use as well (PEP 562 module __getattr__).
+'''
 
-from .delta import move as delta
-from .epsilon import move as epsilon
+import importlib
+from collections import namedtuple
 
-from .mcts_base import move as mcts_base
 
-from .deep_ai import move as deep_ai
+# name: shown in the menus
+# module, attribute: where the move function (or callable bot) lives
+# stateful: keeps state between moves (transposition table, tree), a bot
+#           reused across moves plays better than a fresh one
+# needs_model: loads the value network
+# in_menu: listed in the bot choices of main.py (and the default bots of arena.py)
+# time_budget: thinking time of a move (s), None for a fixed depth search
+AlgorithmInfo = namedtuple('AlgorithmInfo',
+                           ['name', 'module', 'attribute', 'stateful', 'needs_model', 'time_budget', 'in_menu'])
 
-from .problem import State,Problem,_move_AI_bounder
\ No newline at end of file
+REGISTRY = {
+    'alpha': AlgorithmInfo('Alpha', 'alpha', 'move', False, False, None, True),
+    'beta': AlgorithmInfo('Beta', 'beta', 'move', True, False, None, False),
+    'delta': AlgorithmInfo('Delta', 'delta', 'move', True, False, None, False),
+    'epsilon': AlgorithmInfo('Epsilon', 'epsilon', 'move', True, False, None, True),
+    'zeta': AlgorithmInfo('Zeta', 'zeta', 'move', True, False, 2.8, True),
+    'eta': AlgorithmInfo('Eta', 'eta', 'move', True, False, None, True),
+    'theta': AlgorithmInfo('Theta', 'theta', 'move', True, False, 2.8, True),
+    'mcts_base': AlgorithmInfo('MCTS_BASE', 'mcts_base', 'move', False, False, 2.8, True),
+    'mcts_reuse': AlgorithmInfo('MCTS_REUSE', 'mcts_base', 'BOT', True, False, 2.8, True),
+    'deep_ai': AlgorithmInfo('DEEP_AI', 'deep_ai', 'move', True, True, None, True),
+}
+
+# names of the package imported on first use
+_LAZY_ATTRIBUTES = {
+    'State': ('problem', 'State'),
+    'Problem': ('problem', 'Problem'),
+    '_move_AI_bounder': ('problem', '_move_AI_bounder'),
+}
+
+
+def get_algorithm(name):
+    '''Move function (or callable bot) registered as `name`.'''
+    info = REGISTRY[name]
+    module = importlib.import_module(f'{__name__}.{info.module}')
+    return getattr(module, info.attribute)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module, attribute = _LAZY_ATTRIBUTES[name]
+        value = getattr(importlib.import_module(f'{__name__}.{module}'), attribute)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
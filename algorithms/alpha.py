@@ -4,6 +4,9 @@ import random
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from algorithms.problem import State, Problem
+from algorithms.bitboard import BitState, BitProblem
+
+USE_BITBOARD = False
 
 
 def move(prev_board, board, player, remain_time_x, remain_time_y):
@@ -22,9 +25,10 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
             eg. ((1,1),(1,2)).  
 
     '''
-    state = State(board, player)
-    prev_state = State(prev_board, -player) if prev_board is not None else None
-    problem = Problem()
+    State_, Problem_ = (BitState, BitProblem) if USE_BITBOARD else (State, Problem)
+    state = State_(board, player)
+    prev_state = State_(prev_board, -player) if prev_board is not None else None
+    problem = Problem_()
     dict_possible_moves = problem.get_possible_moves(prev_state, state)
     all_possible_moves = []
 
@@ -6,9 +6,16 @@ import random
 import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from algorithms.problem import State, Problem
+from algorithms import tt
 
 MAX_DEPTH = 4
 
+# kept across moves, see algorithms/tt.py
+TT = tt.TranspositionTable()
+
+# nodes, cutoffs and table probes of the last search, see bench.py
+LAST_STATS = {}
+
 def move(prev_board, board, player, remain_time_x, remain_time_y):
     '''
         Get random move
@@ -28,36 +35,24 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
     state = State(board, player)
     prev_state = State(prev_board, -player) if prev_board is not None else None
     problem = Problem()
-    visited_states = {}
-
-    def _hash_state(state: State):
-        hash_value = ''
-        for coor_y in range(state.height):
-            for coor_x in range(state.width):
-                hash_value +=   chr(98+state.board[coor_y][coor_x])
-        hash_value += chr(98+state.player)
-        return hash_value
-
-    def _is_visited(hased_state, depth):
-        return hased_state in visited_states \
-            and visited_states[hased_state][depth] is not None
-
-    def _add_visited_state(hased_state, depth, score, action):
-        if hased_state not in visited_states:
-            visited_states[hased_state] = [None]*(MAX_DEPTH+1)
-        visited_states[hased_state][depth] = (action, score)
+    TT.new_search()
+    stats = {'nodes': 0, 'cutoffs': 0}
+    probes, hits = TT.probes, TT.hits
 
     def _calculate_score(state: State):
         return np.sum(state.board)
         
     def _minimax(prev_state, state, depth, alpha, beta):
+        stats['nodes'] += 1
         if(depth == 0):
             return (), _calculate_score(state)
 
-        hased_state = _hash_state(state)
-
-        if _is_visited(hased_state, depth):
-            return visited_states[hased_state][depth]
+        entry = TT.probe(state.key)
+        if entry is not None:
+            score = tt.get_cutoff(entry, depth, alpha, beta)
+            if score is not None:
+                return entry[tt.MOVE], score
+        alpha_orig, beta_orig = alpha, beta
 
         # Get all possible actions
         dict_possible_moves = problem.get_possible_moves(prev_state, state)
@@ -69,13 +64,7 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
                 for end in possible_moves:
                     next_move = (start, end)
                     next_state = problem.move(state, next_move)
-                    hased_next_state = _hash_state(next_state)
-
-                    if(_is_visited(hased_next_state, depth-1)):
-                        action, value = visited_states[hased_next_state][depth-1]
-                    else:
-                        action, value = _minimax(state, next_state, depth-1, alpha, beta)
-                        _add_visited_state(hased_next_state, depth-1, value, action)
+                    action, value = _minimax(state, next_state, depth-1, alpha, beta)
 
                     if value > max_value:
                         max_value = value
@@ -83,13 +72,17 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
                         
                     alpha = max(alpha, max_value)
                     if(beta <= alpha):
+                        stats['cutoffs'] += 1
                         break
+                if(beta <= alpha):
+                    break
 
             if best_action is None:
                 for start in dict_possible_moves.keys():
                     best_action = (start,dict_possible_moves[start][0])
                     break
 
+            TT.store(state.key, depth, max_value, tt.get_flag(max_value, alpha_orig, beta_orig), best_action)
             return best_action, max_value
             
         else:
@@ -98,13 +91,7 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
                 for end in possible_moves:
                     next_move = (start, end)
                     next_state = problem.move(state, next_move)
-                    hased_next_state = _hash_state(next_state)
-
-                    if(_is_visited(hased_next_state, depth-1)):
-                        action, value = visited_states[hased_next_state][depth-1]
-                    else:
-                        action, value = _minimax(state, next_state, depth-1, alpha, beta)
-                        _add_visited_state(hased_next_state, depth-1, value, action)
+                    action, value = _minimax(state, next_state, depth-1, alpha, beta)
 
                     if value < min_value:
                         min_value = value
@@ -112,16 +99,24 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
 
                     beta = min(beta, min_value)
                     if(beta <= alpha):
+                        stats['cutoffs'] += 1
                         break
+                if(beta <= alpha):
+                    break
 
             if best_action is None:
                 for start in dict_possible_moves.keys():
                     best_action = (start,dict_possible_moves[start][0])
                     break
 
+            TT.store(state.key, depth, min_value, tt.get_flag(min_value, alpha_orig, beta_orig), best_action)
             return best_action, min_value
 
+    problem.set_open_move(state, problem.get_open_move(prev_state, state))
+    start_time = time.time()
     action, value = _minimax(prev_state, state, MAX_DEPTH, -1000, 1000)
+    LAST_STATS.update(stats, tt_probes=TT.probes - probes, tt_hits=TT.hits - hits,
+                      time=time.time() - start_time)
     return action
 
 
@@ -0,0 +1,279 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from algorithms.problem import get_board_tables, get_zobrist_keys, UndoRecord
+
+
+'''
+    Bitboard game core. Each side is one int mask with bit (y*5 + x) set for
+    every point it occupies. BitState/BitProblem keep the contract of
+    State/Problem (get_possible_moves, move, check_winning_state, ...) so the
+    bots can switch engine with their USE_BITBOARD flag.
+'''
+
+
+HEIGHT = 5
+WIDTH = 5
+SIZE = HEIGHT * WIDTH
+FULL = (1 << SIZE) - 1
+
+COORS = tuple(divmod(index, WIDTH) for index in range(SIZE))
+
+
+def _to_mask(positions):
+    return sum(1 << (pos_y * WIDTH + pos_x) for pos_y, pos_x in positions)
+
+_neighbors, _is_diagonal, _capture_pairs = get_board_tables(HEIGHT, WIDTH)
+
+# NEIGHBORS[i]: mask of points connected to point i
+# CAPTURE_PAIRS[i]: masks of the (a, b) pairs flanking point i (ganh/capture)
+# EVEN: mask of points with diagonal lines
+NEIGHBORS = tuple(_to_mask(_neighbors[pos]) for pos in COORS)
+CAPTURE_PAIRS = tuple(tuple(_to_mask(pair) for pair in _capture_pairs[pos]) for pos in COORS)
+EVEN = _to_mask(pos for pos in COORS if _is_diagonal[pos])
+
+# Zobrist keys by point index, same values as State's
+_piece_keys, _open_keys, PLAYER_KEY = get_zobrist_keys(HEIGHT, WIDTH)
+PIECE_KEYS = {player: tuple(_piece_keys[player][pos] for pos in COORS) for player in (1, -1)}
+OPEN_KEYS = tuple(_open_keys[pos] for pos in COORS)
+NOT_COL_0 = FULL & ~sum(1 << (coor_y * WIDTH) for coor_y in range(HEIGHT))
+NOT_COL_4 = FULL & ~sum(1 << (coor_y * WIDTH + WIDTH - 1) for coor_y in range(HEIGHT))
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def dilate(mask):
+    '''Mask of every point connected to at least one point of `mask`.'''
+    even = mask & EVEN
+    grown = (mask << WIDTH) | (mask >> WIDTH) \
+        | ((mask & NOT_COL_4) << 1) | ((mask & NOT_COL_0) >> 1) \
+        | ((even & NOT_COL_4) << (WIDTH + 1)) | ((even & NOT_COL_0) << (WIDTH - 1)) \
+        | ((even & NOT_COL_4) >> (WIDTH - 1)) | ((even & NOT_COL_0) >> (WIDTH + 1))
+    return grown & FULL
+
+
+class BitState:
+    height = HEIGHT
+    width = WIDTH
+
+    def __init__(self, board: list, player: int):
+        board = np.asarray(board).reshape(-1)
+        self._set_masks(sum(1 << index for index in np.flatnonzero(board == 1).tolist()),
+                        sum(1 << index for index in np.flatnonzero(board == -1).tolist()),
+                        player)
+
+    def _set_masks(self, x: int, o: int, player: int):
+        self.x = x
+        self.o = o
+        self.player = player
+        self._board = None
+
+        # same key as State.key
+        self.key = PLAYER_KEY if player == -1 else 0
+        for index in iter_bits(x):
+            self.key ^= PIECE_KEYS[1][index]
+        for index in iter_bits(o):
+            self.key ^= PIECE_KEYS[-1][index]
+        self.open_point = None
+
+    @classmethod
+    def from_masks(cls, x: int, o: int, player: int):
+        state = cls.__new__(cls)
+        state._set_masks(x, o, player)
+        return state
+
+    def copy(self):
+        state = BitState.__new__(BitState)
+        state.__dict__.update(self.__dict__)
+        return state
+
+    @property
+    def board(self):
+        # numpy view for callers of the State contract, built on first access
+        if self._board is None:
+            board = np.zeros(SIZE, dtype=int)
+            board[list(iter_bits(self.x))] = 1
+            board[list(iter_bits(self.o))] = -1
+            self._board = board.reshape(HEIGHT, WIDTH)
+        return self._board
+
+    def __eq__(self, other):
+        return self.x == other.x and self.o == other.o \
+            and self.player == other.player
+
+    def __str__(self):
+        str_board = '\n       '.join(str(self.board).split('\n'))
+        str_board = str_board.replace('-1', ' O')
+        str_board = str_board.replace('1', 'X')
+        str_board = str_board.replace('0', '+')
+
+        str_player = 'X' if self.player == 1 else 'O'
+
+        return f'Board: {str_board}\nPlayer\'s turn: {str_player}'
+
+    def __hash__(self):
+        # equality ignores the open point, so must the hash
+        if self.open_point is None:
+            return hash(self.key)
+        return hash(self.key ^ OPEN_KEYS[self.open_point[0] * WIDTH + self.open_point[1]])
+
+    def material(self):
+        return popcount(self.x) - popcount(self.o)
+
+    def check_winning_state(self):
+        # return: one of below:
+        #           (1)  1: player 1 win
+        #           (2) -1: player 2 win
+        #           (3)  0: continue
+        if not self.x:
+            return -1
+        if not self.o:
+            return 1
+        return 0
+
+
+class BitProblem:
+    def __init__(self):
+        self.init_state = BitState(
+            board=[[ 1,  1,  1,  1,  1],
+                   [ 1,  0,  0,  0,  1],
+                   [ 1,  0,  0,  0, -1],
+                   [-1,  0,  0,  0, -1],
+                   [-1, -1, -1, -1, -1]],
+            player = 1
+        )
+
+    def get_open_move(self, prev_state: BitState, state: BitState):
+        '''Same as Problem.get_open_move.'''
+        if prev_state is None:
+            return None
+        if prev_state.player != -state.player:
+            raise Exception("Invalid state")
+        left = (prev_state.x | prev_state.o) & ~(state.x | state.o)
+        came = (state.x | state.o) & ~(prev_state.x | prev_state.o)
+        prev_action = COORS[left.bit_length() - 1] if left else None
+        now_action = COORS[came.bit_length() - 1] if came else None
+        return (prev_action, now_action)
+
+    def get_possible_moves(self, prev_state: BitState, state: BitState):
+        '''Same as Problem.get_possible_moves.'''
+        return self.get_possible_moves_after(state, self.get_open_move(prev_state, state))
+
+    def get_possible_moves_after(self, state: BitState, action):
+        '''Same as Problem.get_possible_moves_after.'''
+        own, opp = (state.x, state.o) if state.player == 1 else (state.o, state.x)
+        empty = FULL & ~(own | opp)
+
+        if action is not None and action[0] is not None:
+            open_point = action[0][0] * WIDTH + action[0][1]
+            for pair in CAPTURE_PAIRS[open_point]:
+                if opp & pair == pair:
+                    trapped = own & NEIGHBORS[open_point]
+                    if trapped:
+                        target = [COORS[open_point]]
+                        return {COORS[index]: target for index in iter_bits(trapped)}
+                    break
+
+        dictionary = {}
+        for index in iter_bits(own):
+            targets = NEIGHBORS[index] & empty
+            if targets:
+                dictionary[COORS[index]] = [COORS[target] for target in iter_bits(targets)]
+        return dictionary
+
+    def move(self, state: BitState, action, inplace=False):
+        '''Same as Problem.move.'''
+        if not inplace:
+            state = state.copy()
+        self.make_move(state, action)
+
+        if not inplace:
+            return state
+
+    def make_move(self, state: BitState, action):
+        '''Same as Problem.make_move, UndoRecord.flipped is a mask here.'''
+        start = action[0][0] * WIDTH + action[0][1]
+        end = action[1][0] * WIDTH + action[1][1]
+        own, opp = (state.x, state.o) if state.player == 1 else (state.o, state.x)
+
+        own = (own & ~(1 << start)) | (1 << end)
+
+        # ganh: flip every opponent pair flanking the destination
+        flipped = 0
+        for pair in CAPTURE_PAIRS[end]:
+            if opp & pair == pair:
+                flipped |= pair
+        own |= flipped
+        opp &= ~flipped
+
+        # chet: flip every opponent group without a path to an empty point
+        frontier = FULL & ~(own | opp)
+        alive = 0
+        while frontier:
+            frontier = dilate(frontier) & opp & ~alive
+            alive |= frontier
+        flipped |= opp & ~alive
+        own |= opp & ~alive
+        opp &= alive
+
+        own_keys, opp_keys = PIECE_KEYS[state.player], PIECE_KEYS[-state.player]
+        key = state.key ^ own_keys[start] ^ own_keys[end] ^ PLAYER_KEY
+        for index in iter_bits(flipped):
+            key ^= own_keys[index] ^ opp_keys[index]
+
+        record = UndoRecord(action, state.player, flipped, state.player, state.key, state.open_point)
+        state.x, state.o = (own, opp) if state.player == 1 else (opp, own)
+        state.player = -state.player
+        state.key = key
+        state._board = None
+        self.set_open_move(state, action)
+        return record
+
+    def set_open_move(self, state: BitState, action):
+        '''Same as Problem.set_open_move.'''
+        if state.open_point is not None:
+            state.key ^= OPEN_KEYS[state.open_point[0] * WIDTH + state.open_point[1]]
+            state.open_point = None
+        if action is None or action[0] is None:
+            return
+        own, opp = (state.x, state.o) if state.player == 1 else (state.o, state.x)
+        start = action[0][0] * WIDTH + action[0][1]
+        if own & NEIGHBORS[start]:
+            for pair in CAPTURE_PAIRS[start]:
+                if opp & pair == pair:
+                    state.open_point = action[0]
+                    state.key ^= OPEN_KEYS[start]
+                    break
+
+    def unmake_move(self, state: BitState, record: UndoRecord):
+        '''Same as Problem.unmake_move.'''
+        start = record.action[0][0] * WIDTH + record.action[0][1]
+        end = record.action[1][0] * WIDTH + record.action[1][1]
+        own, opp = (state.x, state.o) if record.player == 1 else (state.o, state.x)
+
+        own = (own & ~(1 << end) & ~record.flipped) | (1 << start)
+        opp |= record.flipped
+
+        state.x, state.o = (own, opp) if record.player == 1 else (opp, own)
+        state.player = record.player
+        state.key = record.key
+        state.open_point = record.open_point
+        state._board = None
+
+    def move_if_possible(self, prev_state: BitState, state: BitState, action, inplace=False):
+        '''Same as Problem.move_if_possible.'''
+        if action[1] in self.get_possible_moves(prev_state, state).get(action[0], []):
+            return True,self.move(state, action, inplace)
+        return False, None
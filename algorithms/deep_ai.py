@@ -6,14 +6,37 @@ import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from algorithms.problem import State, Problem
-
-from tensorflow.keras.models import load_model
+from algorithms.bitboard import BitState, BitProblem
+from algorithms import tt
+from ml_algorithms import runtime
 
 '''
     Improve delta with ordering move
 '''
 
 MAX_DEPTH = 3
+USE_BITBOARD = False
+BACKEND = 'numpy' # value network backend, 'numpy' or 'tensorflow', see ml_algorithms/runtime.py
+# leaves under a node of depth LEAF_BATCH_DEPTH are scored together before
+# its search (0: each leaf when reached), BATCH_SIZE boards per model call
+LEAF_BATCH_DEPTH = 1
+BATCH_SIZE = 256
+
+# leaves scored by the model in the last search, see benchmark
+LAST_STATS = {}
+
+# kept across moves, see algorithms/tt.py
+TT = tt.TranspositionTable()
+
+_models = {} # loaded once per backend
+
+
+def get_model(backend=None):
+    backend = backend or BACKEND
+    if backend not in _models:
+        _models[backend] = runtime.load_model(backend)
+    return _models[backend]
+
 
 def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None):
     '''
@@ -31,38 +54,20 @@ def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None
             eg. ((1,1),(1,2)).  
     '''
 
-    state = State(board, player)
-    prev_state = State(prev_board, -player) if prev_board is not None else None
-    problem = Problem()
-    visited_states = {}
+    State_, Problem_ = (BitState, BitProblem) if USE_BITBOARD else (State, Problem)
+    state = State_(board, player)
+    prev_state = State_(prev_board, -player) if prev_board is not None else None
+    problem = Problem_()
     if model_cnn is None:
-        model_cnn = load_model('./ml_algorithms/model/model.h5')
-
-    def _hash_state(state: State):
-        hash_value = ''
-        for coor_y in range(state.height):
-            for coor_x in range(state.width):
-                hash_value +=   chr(98+state.board[coor_y][coor_x])
-        hash_value += chr(98+state.player)
-        return hash_value
-
-    def _is_visited(hased_state, depth):
-        return hased_state in visited_states and \
-            visited_states[hased_state][0] >= depth
-
-    def _add_visited_state(hased_state, depth, score):
-        if hased_state not in visited_states:
-            visited_states[hased_state] = [depth,score]
-        elif visited_states[hased_state][0] < depth:
-            visited_states[hased_state][0] = depth
-            visited_states[hased_state][1] = score
+        model_cnn = get_model()
+    TT.new_search()
 
     def _calculate_score(state: State):
         # use for sort branch
-        return np.sum(state.board)
+        return state.material()
 
-    def _evaluate_state(prev_state, cur_state):
-        # model here
+    def _board3d(prev_state, cur_state):
+        # model input of a leaf, (5, 5, 4)
         board3d = np.zeros((4, 5, 5))
 
         if cur_state.player == 1:
@@ -76,14 +81,44 @@ def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None
             board3d[1] = (cur_state.board == -1).astype(np.int8)
             board3d[2] = (prev_state.board == 1).astype(np.int8)
             board3d[3] = (prev_state.board == -1).astype(np.int8)
-        
-        board3d = np.expand_dims(board3d, 0)
-        board3d = np.transpose(board3d, (0, 2, 3, 1))
 
+        return np.transpose(board3d, (1, 2, 0))
+
+    def _predict(boards3d):
+        LAST_STATS['leaves'] += len(boards3d)
+        LAST_STATS['calls'] += 1
+        return np.asarray(model_cnn.predict_on_batch(np.stack(boards3d))).reshape(-1)
+
+    # scores of the leaves of the subtree being searched, by (prev key, key)
+    leaf_scores = {}
+
+    def _collect_leaves(prev_state, state, depth, leaves):
+        # every non terminal leaf under state, no pruning: the model is
+        # cheaper on one batch than on the few leaves alpha-beta would skip
+        if state.check_winning_state() != 0:
+            return
+        if depth == 0:
+            leaves[(prev_state.key, state.key)] = _board3d(prev_state, state)
+            return
+        for start, possible_ends in problem.get_possible_moves(prev_state, state).items():
+            for end in possible_ends:
+                _collect_leaves(state, problem.move(state, (start, end)), depth-1, leaves)
+
+    def _evaluate_leaves(prev_state, state, depth):
+        leaves = {}
+        _collect_leaves(prev_state, state, depth, leaves)
+        leaf_scores.clear()
+        keys, boards3d = list(leaves.keys()), list(leaves.values())
+        for begin in range(0, len(keys), BATCH_SIZE):
+            scores = _predict(boards3d[begin:begin + BATCH_SIZE])
+            leaf_scores.update(zip(keys[begin:begin + BATCH_SIZE], scores.tolist()))
+
+    def _evaluate_state(prev_state, cur_state):
+        key = (prev_state.key, cur_state.key)
+        if key not in leaf_scores:
+            return _predict([_board3d(prev_state, cur_state)])[0]
+        return leaf_scores[key]
 
-        result = model_cnn(board3d)[0][0]
-        return result
-        
     def _minimax(prev_state, state, depth, alpha, beta):
         if state.check_winning_state() != 0:
             return (), 1000*state.check_winning_state()
@@ -91,7 +126,17 @@ def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None
         if(depth == 0):
             return (), _evaluate_state(prev_state, state)
 
-        hased_state = _hash_state(state)
+        hint_move = None
+        entry = TT.probe(state.key)
+        if entry is not None:
+            score = tt.get_cutoff(entry, depth, alpha, beta)
+            if score is not None and entry[tt.MOVE] is not None:
+                return entry[tt.MOVE], score
+            hint_move = entry[tt.MOVE]
+        alpha_orig, beta_orig = alpha, beta
+
+        if depth == LEAF_BATCH_DEPTH:
+            _evaluate_leaves(prev_state, state, depth)
 
         # Get all possible actions
         dict_possible_moves = problem.get_possible_moves(prev_state, state)
@@ -109,17 +154,11 @@ def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None
         best_score  = 0
 
         if(state.player == 1):
-            next_states_info.sort(key=lambda x: x[0], reverse=True) # sort by score
+            next_states_info.sort(key=lambda x: (x[1] == hint_move, x[0]), reverse=True) # hint first, then by score
 
             best_score = -1000
             for _, next_move, next_state in next_states_info:
-                hased_next_state = _hash_state(next_state)
-
-                if(_is_visited(hased_next_state, depth-1)):
-                    value = visited_states[hased_next_state][1]
-                else:
-                    _, value = _minimax(state, next_state, depth-1, alpha, beta)
-                    _add_visited_state(hased_next_state, depth-1, value)
+                _, value = _minimax(state, next_state, depth-1, alpha, beta)
 
                 if value > best_score:
                     best_score = value
@@ -131,17 +170,11 @@ def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None
                 if(beta <= alpha): break
             
         else:
-            next_states_info.sort(key=lambda x: x[0], reverse=False) # sort by score
+            next_states_info.sort(key=lambda x: (x[1] != hint_move, x[0]), reverse=False) # hint first, then by score
 
             best_score = 1000
             for _, next_move, next_state in next_states_info:
-                hased_next_state = _hash_state(next_state)
-
-                if(_is_visited(hased_next_state, depth-1)):
-                    value = visited_states[hased_next_state][1]
-                else:
-                    _, value = _minimax(state, next_state, depth-1, alpha, beta)
-                    _add_visited_state(hased_next_state, depth-1, value)
+                _, value = _minimax(state, next_state, depth-1, alpha, beta)
 
                 if value < best_score:
                     best_score = value
@@ -157,12 +190,35 @@ def move(prev_board, board, player, remain_time_x, remain_time_y, model_cnn=None
                 best_move = (start,dict_possible_moves[start][0])
                 break
 
+        TT.store(state.key, depth, best_score, tt.get_flag(best_score, alpha_orig, beta_orig), best_move)
         return best_move, best_score
 
+    LAST_STATS.update(leaves=0, calls=0)
+    start_time = time.time()
+    problem.set_open_move(state, problem.get_open_move(prev_state, state))
     action, value = _minimax(prev_state, state, MAX_DEPTH, -1000, 1000)
+    LAST_STATS['time'] = time.time() - start_time
     return action
 
 
+def benchmark(model_cnn, positions, settings=((0, 1), (1, 1), (1, 32), (2, 32), (2, 256))):
+    '''
+        Leaves/s of the search of `positions` for (LEAF_BATCH_DEPTH,
+        BATCH_SIZE) settings. positions: list of (prev_board, board, player).
+    '''
+    global LEAF_BATCH_DEPTH, BATCH_SIZE
+    for LEAF_BATCH_DEPTH, BATCH_SIZE in settings:
+        leaves = calls = elapsed = 0
+        for prev_board, board, player in positions:
+            TT.clear()
+            move(prev_board, board, player, 5000, 5000, model_cnn)
+            leaves += LAST_STATS['leaves']
+            calls += LAST_STATS['calls']
+            elapsed += LAST_STATS['time']
+        print(f'batch depth {LEAF_BATCH_DEPTH} size {BATCH_SIZE:3d}: {leaves:6d} leaves '
+              f'in {calls:5d} calls, {leaves / elapsed:8.0f} leaves/s, {elapsed:6.2f}s')
+
+
 if __name__ == '__main__':
     prev_board = [[-1, 0, -1, 1, 1],
                     [-1, -1, 0, 0, 1],
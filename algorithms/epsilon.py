@@ -1,11 +1,10 @@
-
-import numpy as np
 import sys
 import os
-import random
 import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from algorithms.problem import State, Problem
+from algorithms.bitboard import BitState, BitProblem
+from algorithms import tt
 
 
 '''
@@ -14,6 +13,13 @@ from algorithms.problem import State, Problem
 
 
 MAX_DEPTH = 5
+USE_BITBOARD = False
+
+# kept across moves, see algorithms/tt.py
+TT = tt.TranspositionTable()
+
+# nodes, cutoffs and table probes of the last search, see bench.py
+LAST_STATS = {}
 
 def move(prev_board, board, player, remain_time_x, remain_time_y):
     '''
@@ -31,69 +37,59 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
             eg. ((1,1),(1,2)).  
     '''
 
-    state = State(board, player)
-    prev_state = State(prev_board, -player) if prev_board is not None else None
-    problem = Problem()
-    visited_states = {}
-
-    def _hash_state(state: State):
-        hash_value = ''
-        for coor_y in range(state.height):
-            for coor_x in range(state.width):
-                hash_value +=   chr(98+state.board[coor_y][coor_x])
-        hash_value += chr(98+state.player)
-        return hash_value
-
-    def _is_visited(hased_state, depth):
-        return hased_state in visited_states and \
-            visited_states[hased_state][0] >= depth
-
-    def _add_visited_state(hased_state, depth, score):
-        if hased_state not in visited_states:
-            visited_states[hased_state] = [depth,score]
-        elif visited_states[hased_state][0] < depth:
-            visited_states[hased_state][0] = depth
-            visited_states[hased_state][1] = score
+    State_, Problem_ = (BitState, BitProblem) if USE_BITBOARD else (State, Problem)
+    state = State_(board, player)
+    prev_state = State_(prev_board, -player) if prev_board is not None else None
+    problem = Problem_()
+    TT.new_search()
+    stats = {'nodes': 0, 'cutoffs': 0}
+    probes, hits = TT.probes, TT.hits
 
     def _calculate_score(state: State):
-        return np.sum(state.board)
+        return state.material()
         
-    def _minimax(prev_state, state, depth, alpha, beta):
+    def _minimax(last_action, state, depth, alpha, beta):
+        stats['nodes'] += 1
         if state.check_winning_state() != 0:
             return (), 1000*state.check_winning_state()
 
         if(depth == 0):
             return (), _calculate_score(state)
 
-        hased_state = _hash_state(state)
+        # Transposition table: cutoff or best move of an earlier search
+        hint_move = None
+        entry = TT.probe(state.key)
+        if entry is not None:
+            score = tt.get_cutoff(entry, depth, alpha, beta)
+            if score is not None and entry[tt.MOVE] is not None:
+                return entry[tt.MOVE], score
+            hint_move = entry[tt.MOVE]
+        alpha_orig, beta_orig = alpha, beta
 
         # Get all possible actions
-        dict_possible_moves = problem.get_possible_moves(prev_state, state)
+        dict_possible_moves = problem.get_possible_moves_after(state, last_action)
 
         # Get all possible state and their info (move to get, score)
         next_states_info = []
         for start, possible_ends in dict_possible_moves.items():
             for end in possible_ends:
                 next_move = (start, end)
-                next_state = problem.move(state, next_move)
-                score = _calculate_score(next_state)
-                next_states_info.append((score,next_move,next_state))
+                record = problem.make_move(state, next_move)
+                score = _calculate_score(state)
+                next_states_info.append((score,next_move))
+                problem.unmake_move(state, record)
 
         best_move = None
         best_score  = 0
 
         if(state.player == 1):
-            next_states_info.sort(key=lambda x: x[0], reverse=True) # sort by score
+            next_states_info.sort(key=lambda x: (x[1] == hint_move, x[0]), reverse=True) # hint first, then by score
 
             best_score = -1000
-            for _, next_move, next_state in next_states_info:
-                hased_next_state = _hash_state(next_state)
-
-                if(_is_visited(hased_next_state, depth-1)):
-                    value = visited_states[hased_next_state][1]
-                else:
-                    _, value = _minimax(state, next_state, depth-1, alpha, beta)
-                    _add_visited_state(hased_next_state, depth-1, value)
+            for _, next_move in next_states_info:
+                record = problem.make_move(state, next_move)
+                _, value = _minimax(next_move, state, depth-1, alpha, beta)
+                problem.unmake_move(state, record)
 
                 if value > best_score:
                     best_score = value
@@ -102,20 +98,18 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
                 if alpha < best_score:
                     alpha = best_score
 
-                if(beta <= alpha): break
+                if(beta <= alpha):
+                    stats['cutoffs'] += 1
+                    break
             
         else:
-            next_states_info.sort(key=lambda x: x[0], reverse=False) # sort by score
+            next_states_info.sort(key=lambda x: (x[1] != hint_move, x[0]), reverse=False) # hint first, then by score
 
             best_score = 1000
-            for _, next_move, next_state in next_states_info:
-                hased_next_state = _hash_state(next_state)
-
-                if(_is_visited(hased_next_state, depth-1)):
-                    value = visited_states[hased_next_state][1]
-                else:
-                    _, value = _minimax(state, next_state, depth-1, alpha, beta)
-                    _add_visited_state(hased_next_state, depth-1, value)
+            for _, next_move in next_states_info:
+                record = problem.make_move(state, next_move)
+                _, value = _minimax(next_move, state, depth-1, alpha, beta)
+                problem.unmake_move(state, record)
 
                 if value < best_score:
                     best_score = value
@@ -124,16 +118,24 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
                 if beta > best_score:
                     beta = best_score
 
-                if(beta <= alpha): break
+                if(beta <= alpha):
+                    stats['cutoffs'] += 1
+                    break
 
         if best_move is None:
             for start in dict_possible_moves.keys():
                 best_move = (start,dict_possible_moves[start][0])
                 break
 
+        TT.store(state.key, depth, best_score, tt.get_flag(best_score, alpha_orig, beta_orig), best_move)
         return best_move, best_score
 
-    action, value = _minimax(prev_state, state, MAX_DEPTH, -1000, 1000)
+    open_move = problem.get_open_move(prev_state, state)
+    problem.set_open_move(state, open_move)
+    start_time = time.time()
+    action, value = _minimax(open_move, state, MAX_DEPTH, -1000, 1000)
+    LAST_STATS.update(stats, tt_probes=TT.probes - probes, tt_hits=TT.hits - hits,
+                      time=time.time() - start_time)
     return action
 
 
@@ -0,0 +1,212 @@
+import sys
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algorithms.problem import State, Problem
+from algorithms.bitboard import BitState, BitProblem
+from algorithms.search import Searcher, WIN_SCORE
+from algorithms import tt
+
+
+'''
+    Improve epsilon by splitting the root moves over a process pool.
+    The first (best ordered) root move is searched alone to get a bound
+    (young brothers wait), then its brothers are searched in parallel with
+    that bound, which every worker raises in shared memory when it finds
+    a better move.
+'''
+
+
+MAX_DEPTH = 5
+NUM_WORKERS = os.cpu_count() or 1
+USE_BITBOARD = True
+
+# kept across moves, in the main process and in every worker
+TT = tt.TranspositionTable()
+
+_pool = None
+_pool_workers = 0
+_shared_bound = None # best root score found so far, from the root player's side
+_search_id = None
+
+
+def _get_game(use_bitboard):
+    return (BitState, BitProblem()) if use_bitboard else (State, Problem())
+
+
+def _init_worker(shared_bound):
+    global _shared_bound
+    _shared_bound = shared_bound
+
+
+def _warm_up(_):
+    # imports and tables are ready once this ran in a worker
+    return os.getpid()
+
+
+def _search_root_move(search_id, board, player, open_move, root_move, depth, use_bitboard):
+    '''
+        Search one root move to `depth`, with the shared bound as window.
+
+        Output
+        ----------
+            (root_move, score, bound, nodes): bound is the one searched
+            against (root player's side), score is exact only if
+            score * player > bound, otherwise it is only an upper bound.
+    '''
+    global _search_id
+    if _search_id != search_id:
+        _search_id = search_id
+        TT.new_search()
+
+    State_, problem = _get_game(use_bitboard)
+    state = State_(board, player)
+    problem.set_open_move(state, open_move)
+    problem.make_move(state, root_move)
+
+    # scores are stored from player 1's side, the bound from the root player's
+    bound = _shared_bound.value
+    alpha, beta = (bound, WIN_SCORE) if player == 1 else (-WIN_SCORE, -bound)
+    searcher = Searcher(problem, TT)
+    _, score = searcher.minimax(root_move, state, depth-1, alpha, beta)
+
+    with _shared_bound.get_lock():
+        if score * player > _shared_bound.value:
+            _shared_bound.value = score * player
+    return root_move, score, bound, searcher.nodes
+
+
+def get_pool(num_workers=None):
+    '''
+        Persistent, pre-warmed pool of `num_workers` processes (default NUM_WORKERS).
+        None when no pool can be used (single worker, or we run inside a
+        daemonic process, which may not have children).
+    '''
+    global _pool, _pool_workers, _shared_bound
+    num_workers = NUM_WORKERS if num_workers is None else num_workers
+    if num_workers <= 1 or multiprocessing.current_process().daemon:
+        return None
+    if _pool is None or _pool_workers != num_workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _shared_bound = multiprocessing.Value('d', -WIN_SCORE)
+        _pool = ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(_shared_bound,))
+        _pool_workers = num_workers
+        list(_pool.map(_warm_up, range(num_workers)))
+    return _pool
+
+
+def search(board, player, open_move, depth=None, num_workers=None):
+    '''
+        Root-split search of `board`, to `depth` with `num_workers` processes
+        (default MAX_DEPTH and NUM_WORKERS, read at call time).
+
+        Output
+        ----------
+            (best_move, score, nodes)
+    '''
+    global _search_id
+    depth = MAX_DEPTH if depth is None else depth
+    State_, problem = _get_game(USE_BITBOARD)
+    state = State_(board, player)
+    problem.set_open_move(state, open_move)
+    TT.new_search()
+
+    searcher = Searcher(problem, TT)
+    root_moves = searcher.order_moves(state, problem.get_possible_moves_after(state, open_move))
+    pool = get_pool(num_workers)
+    if pool is None or len(root_moves) <= 1: # also a root without moves
+        best_move, score = searcher.minimax(open_move, state, depth, -WIN_SCORE, WIN_SCORE, root_moves)
+        return best_move, score, searcher.nodes
+
+    # eldest brother first, it sets the bound of the others
+    best_move = root_moves[0]
+    record = problem.make_move(state, best_move)
+    _, best_score = searcher.minimax(best_move, state, depth-1, -WIN_SCORE, WIN_SCORE)
+    problem.unmake_move(state, record)
+    nodes = searcher.nodes
+
+    _search_id = (os.getpid(), time.time())
+    _shared_bound.value = best_score * player
+    board = state.board.tolist()
+    futures = [pool.submit(_search_root_move, _search_id, board, player, open_move,
+                           root_move, depth, USE_BITBOARD)
+               for root_move in root_moves[1:]]
+    for future in as_completed(futures):
+        root_move, score, bound, worker_nodes = future.result()
+        nodes += worker_nodes
+        # a move failing low (score at or below its bound) may tie the best
+        # score while being worse, only exact scores are taken
+        if score * player > bound and score * player > best_score * player:
+            best_move, best_score = root_move, score
+
+    return best_move, best_score, nodes
+
+
+def move(prev_board, board, player, remain_time_x, remain_time_y):
+    '''
+        Get best move of a parallel depth MAX_DEPTH search
+
+        Input
+        ----------
+            board: map(5*5);
+            player: 1 or -1, represent for player
+            remain_time_x: Time remain (ms)
+            remain_time_y: Time remain (ms)
+        Output
+        ----------
+            optimize action from all possible action.
+            eg. ((1,1),(1,2)).
+    '''
+    problem = Problem()
+    prev_state = State(prev_board, -player) if prev_board is not None else None
+    open_move = problem.get_open_move(prev_state, State(board, player))
+    action, _, _ = search(board, player, open_move)
+    return action
+
+
+def benchmark(positions, depth=None, workers=(1, 2, 4, 8)):
+    '''
+        Time the search of fixed positions with 1..N workers.
+        positions: list of (prev_board, board, player).
+    '''
+    problem = Problem()
+    base_time = None
+    for num_workers in workers:
+        get_pool(num_workers) # spawn and warm up out of the timing
+        TT.clear()
+        start = time.time()
+        nodes = 0
+        for prev_board, board, player in positions:
+            prev_state = State(prev_board, -player) if prev_board is not None else None
+            open_move = problem.get_open_move(prev_state, State(board, player))
+            _, _, search_nodes = search(board, player, open_move, depth, num_workers)
+            nodes += search_nodes
+        elapsed = time.time() - start
+        base_time = base_time or elapsed
+        print(f'{num_workers:2d} workers: {elapsed:6.2f}s  {nodes/elapsed:9.0f} nodes/s  speedup {base_time/elapsed:4.2f}x')
+
+
+if __name__ == '__main__':
+    prev_board = [[-1, 0, -1, 1, 1],
+                    [-1, -1, 0, 0, 1],
+                    [-1, 0, 1, 0, 1],
+                    [1, 1, 0, 0, 1],
+                    [1, 1, 0, 0, 1]]
+    board = [[-1, 0,  0,  1,  -1],
+                [-1, -1,  0,  -1,  1],
+                [-1, 0,  -1,  0, 1],
+                [1, 1,  0,  0, 1],
+                [1, 1, 0, 0, 1]]
+    positions = [
+        (None, Problem().init_state.board.tolist(), 1),
+        (prev_board, board, -1),
+        (board, [[-1, 0,  0,  1,  -1],
+                 [-1, -1,  0,  -1,  1],
+                 [-1, 0,  -1,  0, 1],
+                 [1, 1,  0,  1, 1],
+                 [1, 1, 0, 0, 0]], 1),
+    ]
+    benchmark(positions, depth=6, workers=sorted({1, 2, 4, NUM_WORKERS}))
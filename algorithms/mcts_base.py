@@ -4,117 +4,431 @@ import sys
 import os
 import random
 import time
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import numpy as np
 
 from algorithms.problem import State, Problem
+from algorithms.bitboard import BitState, BitProblem
+from algorithms.rollout import batch_rollout
 
 MAX_DEPTH = 7
 TIME_THINKING = 2.8
+MAX_PLAYOUTS = None # playout budget of a serial search, None for the clock only
+USE_BITBOARD = False
+ROLLOUT_BATCH = 1 # playouts of a leaf, more than 1 uses the batch engine of rollout.py
+MAX_TREE_NODES = 1 << 20 # largest tree MCTSBot keeps between moves (~43 bytes a node)
 
-class MCTSNode:
-    def __init__(self, prev_state, state: State, problem, parent=None, parent_action=None):
-        self.state = state
-        self.prev_state = prev_state
-        self.parent = parent
-        self.parent_action = parent_action
+# 'serial': one tree in this process
+# 'root': every worker grows its own tree, root statistics are merged
+# 'tree': one tree, rollouts of a batch of leaves (kept apart by virtual
+#         loss) run on the workers
+PARALLEL_MODE = 'serial'
+NUM_WORKERS = os.cpu_count() or 1
 
-        self.children = []
-        self._number_of_visits = 0
+# playouts, time, playouts/s and tree size of the last search
+LAST_STATS = {}
 
-        self._results = defaultdict(int)
-        self._results[1] = 0
-        self._results[-1] = 0
+_pool = None
+_pool_workers = 0
 
-        self._untried_actions = []
-        for start, possible_moves in problem.get_possible_moves(prev_state, state).items():
-            for end in possible_moves:
-                self._untried_actions.append((start,end))
+_POWERS = 1 << np.arange(64, dtype=np.int64)
 
-    def q(self):
-        wins = self._results[1]
-        loses = self._results[-1]
-        return wins - loses
+def _pack(state):
+    # (x, o) masks of the pieces of player 1 and -1, bit y*width + x
+    if isinstance(state, BitState):
+        return state.x, state.o
+    board = state.board.reshape(-1)
+    powers = _POWERS[:len(board)]
+    return int(powers[board == 1].sum()), int(powers[board == -1].sum())
 
-    def n(self):
-        return self._number_of_visits
 
-    def is_fully_expanded(self):
-        return len(self._untried_actions) == 0
-
-    def is_terminal_node(self):
-        return self.state.check_winning_state() != 0
-
-    def best_child(self, c_param=0.1):
-        choices_weights = [(c.q() / c.n()) + c_param * np.sqrt((2 * np.log(self.n()) / c.n())) for c in self.children]
-        return self.children[np.argmax(choices_weights)]
-
-    def backpropagate(self, result):
-        self._number_of_visits += 1.
-        self._results[result] += 1.
-        if self.parent:
-            self.parent.backpropagate(result)
+def _unpack(x, o, player, state_type, height, width):
+    if state_type is BitState:
+        return BitState.from_masks(x, o, player)
+    powers = _POWERS[:height * width]
+    board = (x & powers > 0).astype(int) - (o & powers > 0)
+    return state_type(board.reshape(height, width), player)
 
 
+class MCTSTree:
+    '''
+        Search tree stored as parallel arrays, one entry per node, node 0 is
+        the root. The children of a node are allocated together the first
+        time they are needed, in [first_child, first_child + num_children),
+        and tried in that order. A tried node keeps its position as two
+        masks, the State object is only built to expand it or roll it out.
+    '''
+    _ARRAYS = {'visits': (np.float64, 0), 'value': (np.float64, 0), 'parent': (np.int32, -1),
+               'first_child': (np.int32, -1), 'num_children': (np.int32, -1),
+               'num_tried': (np.int32, 0), 'action': (np.int16, 0),
+               'x': (np.uint32, 0), 'o': (np.uint32, 0), 'player': (np.int8, 0)}
+
+    def __init__(self, prev_state, state, problem, capacity=1 << 12):
+        self.problem = problem
+        self.open_move = problem.get_open_move(prev_state, state)
+        self.state_type = type(state)
+        self.height, self.width = state.height, state.width
+        self.size = 1
+
+        # visits, value: wins - loses, from player 1's side
+        # num_children: -1 until the moves of the node are generated
+        # action: start*25 + end of the move from the parent, points as y*5 + x
+        # x, o, player: position of the node once tried
+        for name, (dtype, fill) in self._ARRAYS.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+        self.x[0], self.o[0] = _pack(state)
+        self.player[0] = state.player
+
+    def _reserve(self, count):
+        if self.size + count <= len(self.visits):
+            return
+        capacity = max(2 * len(self.visits), self.size + count)
+        for name, (dtype, fill) in self._ARRAYS.items():
+            grown = np.full(capacity, fill, dtype=dtype)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def nbytes(self):
+        '''Bytes held by the arrays, their spare capacity included.'''
+        return sum(getattr(self, name).nbytes for name in self._ARRAYS)
+
+    def bytes_per_node(self):
+        '''Bytes of one node over all the arrays (a row of a 2-D array).'''
+        return sum(getattr(self, name).itemsize * int(np.prod(getattr(self, name).shape[1:]))
+                   for name in self._ARRAYS)
+
+    def get_action(self, node):
+        start, end = divmod(int(self.action[node]), self.height * self.width)
+        return (divmod(start, self.width), divmod(end, self.width))
+
+    def get_last_action(self, node):
+        '''Move that led to the node, the open move of the game for the root.'''
+        return self.get_action(node) if node else self.open_move
+
+    def get_state(self, node):
+        return _unpack(int(self.x[node]), int(self.o[node]), int(self.player[node]),
+                       self.state_type, self.height, self.width)
+
+    def _expand(self, node, state):
+        # children in the reverse order of the moves, as MCTSNode popped them
+        dict_possible_moves = self.problem.get_possible_moves_after(state, self.get_last_action(node))
+        actions = [(start, end) for start, possible_moves in dict_possible_moves.items()
+                   for end in possible_moves][::-1]
+        self._reserve(len(actions))
+        first = self.size
+        self.size += len(actions)
+        self.first_child[node] = first
+        self.num_children[node] = len(actions)
+        self.parent[first:self.size] = node
+        width, size = self.width, self.height * self.width
+        self.action[first:self.size] = [(start[0]*width + start[1]) * size + end[0]*width + end[1]
+                                        for start, end in actions]
+
+    def best_child(self, node, c_param=0.1):
+        first = self.first_child[node]
+        children = slice(first, first + self.num_tried[node])
+        visits = self.visits[children]
+        choices_weights = self.value[children] / visits \
+            + c_param * np.sqrt(2 * np.log(self.visits[node]) / visits)
+        return first + int(np.argmax(choices_weights))
+
+    def select(self):
+        '''
+            Walk the tree policy from the root, trying one new child on the
+            way if a node is not fully expanded.
+
+            Output
+            ----------
+                (path, state, last_action): nodes from the root to the leaf,
+                state of the leaf and the move that led to it.
+        '''
+        node, path = 0, [0]
+        while self.x[node] and self.o[node]: # game continue
+            state = None
+            if self.num_children[node] < 0:
+                state = self.get_state(node)
+                self._expand(node, state)
+            if self.num_tried[node] < self.num_children[node]:
+                child = int(self.first_child[node] + self.num_tried[node])
+                self.num_tried[node] += 1
+                state = state or self.get_state(node)
+                last_action = self.get_action(child)
+                self.problem.make_move(state, last_action)
+                self.x[child], self.o[child] = _pack(state)
+                self.player[child] = state.player
+                path.append(child)
+                return path, state, last_action
+            if self.num_children[node] == 0:
+                break # no possible move, the node is the leaf
+            node = self.best_child(node)
+            path.append(node)
+        return path, self.get_state(node), self.get_last_action(node)
+
+    def backpropagate(self, path, result, count=1.):
+        self.visits[path] += count
+        self.value[path] += result * count
+
+    def add_virtual_loss(self, path, loss=-1):
+        # counted as a lost visit until its rollout is back, so that the
+        # next selections of a batch go elsewhere
+        self.visits[path] += 1.
+        self.value[path] += loss
+
+    def remove_virtual_loss(self, path, loss=-1):
+        self.visits[path] -= 1.
+        self.value[path] -= loss
+
+    def find_child(self, node, action):
+        '''Tried child of `node` reached by `action`, None if there is none.'''
+        if self.num_children[node] <= 0:
+            return None
+        (start_y, start_x), (end_y, end_x) = action
+        size = self.height * self.width
+        code = (start_y*self.width + start_x) * size + end_y*self.width + end_x
+        first = self.first_child[node]
+        tried = np.flatnonzero(self.action[first:first + self.num_tried[node]] == code)
+        return first + int(tried[0]) if len(tried) else None
+
+    def subtree_size(self, node):
+        '''Number of nodes of the subtree of `node` (allocated children included).'''
+        return len(self._subtree_order(node))
+
+    def _subtree_order(self, node):
+        # nodes of the subtree, the children of a node stay contiguous
+        order = [node]
+        for current in order:
+            if self.num_children[current] > 0:
+                first = self.first_child[current]
+                order.extend(range(first, first + self.num_children[current]))
+        return order
+
+    def reroot(self, node):
+        '''
+            Keep only the subtree of `node`, which becomes the root, in place.
+            The arrays are compacted so the dropped nodes free their memory.
+        '''
+        order = np.array(self._subtree_order(node))
+        new_index = np.full(self.size, -1, dtype=np.int32)
+        new_index[order] = np.arange(len(order), dtype=np.int32)
+
+        self.open_move = self.get_action(node)
+        for name in self._ARRAYS:
+            setattr(self, name, getattr(self, name)[order])
+        self.parent = np.where(self.parent >= 0, new_index[self.parent], -1).astype(np.int32)
+        self.parent[0] = -1
+        self.first_child = np.where(self.first_child >= 0, new_index[self.first_child], -1).astype(np.int32)
+        self.size = len(order)
+
+    def root_statistics(self):
+        first = self.first_child[0]
+        return {self.get_action(child): (self.value[child], self.visits[child])
+                for child in range(first, first + self.num_tried[0])}
+
+    def best_action(self):
+        return self.get_action(self.best_child(0))
+
+
+def rollout(problem, state, last_action, max_depth=None):
+    '''
+        Play random moves from `state` (left unchanged) until the game ends
+        or max_depth moves (default MAX_DEPTH) are played.
 
-def mcts(prev_state, state, problem, remain_time):
-    def _expand(current_node: MCTSNode):
-        action = current_node._untried_actions.pop()
-        next_state = problem.move(current_node.state, action)
-        child_node = MCTSNode(
-            current_node.state, next_state, problem, parent=current_node, parent_action=action)
+        Output
+        ----------
+            1, -1 or 0: sign of the material at the end.
+    '''
+    max_depth = MAX_DEPTH if max_depth is None else max_depth
+    current_rollout_state = state.copy()
+    while current_rollout_state.check_winning_state() == 0: # game continue  
+        # choose random move   
+        dict_possible_moves = problem.get_possible_moves_after(current_rollout_state, last_action)
+        random_start = random.choice(list(dict_possible_moves.keys()))
+        random_end = random.choice(dict_possible_moves[random_start])
+        random_move = (random_start,random_end)
+        # next state
+        last_action = random_move
+        problem.make_move(current_rollout_state, random_move)
+
+        max_depth -= 1
+        if max_depth == 0: break
+
+    # return current_rollout_state.check_winning_state()
+    diff = current_rollout_state.material()
+    return (diff) / abs(diff) if diff != 0 else 0
+
+
+def grow_tree(prev_state, state, problem, remain_time, pool=None, batch_size=1, tree=None):
+    '''
+        Grow a tree from `state` during remain_time (s).
 
-        current_node.children.append(child_node)
-        return child_node 
+        Input
+        ----------
+            pool: rollouts run on it, batch_size leaves at a time, if given.
+            tree: MCTSTree rooted at `state` to keep growing, a new one if None.
 
-    def _tree_policy(current_node: MCTSNode):
-        while not current_node.is_terminal_node():
-            if not current_node.is_fully_expanded():
-                return _expand(current_node)
-            else:
-                current_node = current_node.best_child()
-        return current_node
-
-    def _rollout(node, max_depth = MAX_DEPTH):
-        prev_rollout_state = node.prev_state
-        current_rollout_state = node.state
-        while current_rollout_state.check_winning_state() == 0: # game continue  
-            # choose random move   
-            dict_possible_moves = problem.get_possible_moves(prev_rollout_state,current_rollout_state)
-            random_start = random.choice(list(dict_possible_moves.keys()))
-            random_end = random.choice(dict_possible_moves[random_start])
-            random_move = (random_start,random_end)
-            # next state
-            prev_rollout_state = current_rollout_state
-            current_rollout_state = problem.move(current_rollout_state, random_move)
-
-            max_depth -= 1
-            if max_depth == 0: break
-
-        # return current_rollout_state.check_winning_state()
-        count_p1 = np.sum(current_rollout_state.board ==  1)
-        count_p2 = np.sum(current_rollout_state.board == -1)
-        diff = count_p1 - count_p2
-        return (diff) / abs(diff) if diff != 0 else 0
-
-
-    root = MCTSNode(prev_state, state, problem)
-    while remain_time > 0:
+        Output
+        ----------
+            (tree, playouts): tree is a MCTSTree.
+    '''
+    def _batch_rollout(path, state, last_action):
+        # ROLLOUT_BATCH playouts at once, backpropagated as that many visits
+        results = batch_rollout(state.board, state.player, last_action and last_action[0],
+                                ROLLOUT_BATCH, rng=rng)
+        for result in (1, -1, 0):
+            count = np.count_nonzero(results == result)
+            if count:
+                tree.backpropagate(path, result, float(count))
+        return len(results)
+
+    rng = np.random.default_rng()
+
+    tree = tree or MCTSTree(prev_state, state, problem)
+    playouts = 0
+    while remain_time > 0 and (MAX_PLAYOUTS is None or pool is not None or playouts < MAX_PLAYOUTS):
         st_time = time.time() # time start
 
-        v = _tree_policy(root)
-        reward = _rollout(v)
-        v.backpropagate(reward)
+        if pool is None:
+            path, state, last_action = tree.select()
+            if ROLLOUT_BATCH > 1:
+                playouts += _batch_rollout(path, state, last_action)
+            else:
+                tree.backpropagate(path, rollout(problem, state, last_action))
+                playouts += 1
+        else:
+            leaves, futures = [], []
+            for _ in range(batch_size):
+                path, state, last_action = tree.select()
+                tree.add_virtual_loss(path)
+                leaves.append(path)
+                futures.append(pool.submit(_rollout_job, state, last_action))
+            for path, future in zip(leaves, futures):
+                tree.remove_virtual_loss(path)
+                tree.backpropagate(path, future.result())
+            playouts += batch_size
 
         ed_time = time.time() # time end
         remain_time -= ed_time-st_time
 
-    return root.best_child().parent_action
+    return tree, playouts
+
+
+_worker_problems = {}
+
+def _rollout_job(state, last_action):
+    # the tables of a Problem are built once per worker, not sent every job
+    if type(state) not in _worker_problems:
+        _worker_problems[type(state)] = BitProblem() if isinstance(state, BitState) else Problem()
+    return rollout(_worker_problems[type(state)], state, last_action)
+
 
+def _grow_root_tree(prev_state, state, problem, remain_time, seed):
+    random.seed(seed)
+    tree, playouts = grow_tree(prev_state, state, problem, remain_time)
+    return tree.root_statistics(), playouts
 
-def move(prev_board, board, player, remain_time_x, remain_time_y):
+
+def _warm_up(_):
+    return os.getpid()
+
+
+def get_pool(num_workers=None):
+    '''
+        Persistent, pre-warmed pool of num_workers processes (default NUM_WORKERS). None when no
+        pool can be used (single worker, or we run inside a daemonic
+        process, which may not have children).
+    '''
+    global _pool, _pool_workers
+    num_workers = NUM_WORKERS if num_workers is None else num_workers
+    if num_workers <= 1 or multiprocessing.current_process().daemon:
+        return None
+    if _pool is None or _pool_workers != num_workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(num_workers)
+        _pool_workers = num_workers
+        list(_pool.map(_warm_up, range(num_workers)))
+    return _pool
+
+
+def mcts(prev_state, state, problem, remain_time, mode=None, num_workers=None):
+    return search_tree(prev_state, state, problem, remain_time, mode, num_workers)[0]
+
+
+def search_tree(prev_state, state, problem, remain_time, mode=None, num_workers=None, tree=None):
+    '''
+        mode and num_workers: default PARALLEL_MODE and NUM_WORKERS, read at
+        call time.
+
+        Output
+        ----------
+            (action, tree): tree is the MCTSTree grown in this process,
+            `tree` if given (it must be rooted at `state`).
+    '''
+    mode = PARALLEL_MODE if mode is None else mode
+    num_workers = NUM_WORKERS if num_workers is None else num_workers
+    start = time.time()
+    pool = get_pool(num_workers) if mode != 'serial' else None
+
+    if pool is None:
+        tree, playouts = grow_tree(prev_state, state, problem, remain_time, tree=tree)
+        action = tree.best_action()
+    elif mode == 'tree':
+        tree, playouts = grow_tree(prev_state, state, problem, remain_time, pool, num_workers, tree)
+        action = tree.best_action()
+    elif mode == 'root':
+        # this process grows one of the trees
+        seeds = random.Random().sample(range(1 << 30), num_workers)
+        futures = [pool.submit(_grow_root_tree, prev_state, state, problem, remain_time, seed)
+                   for seed in seeds[1:]]
+        tree, playouts = grow_tree(prev_state, state, problem, remain_time, tree=tree)
+
+        results = defaultdict(lambda: [0, 0])
+        for statistics in [tree.root_statistics()] + [future.result()[0] for future in futures]:
+            for child_action, (q, n) in statistics.items():
+                results[child_action][0] += q
+                results[child_action][1] += n
+        playouts += sum(future.result()[1] for future in futures)
+
+        # best_child over the merged counts
+        total = sum(n for _, n in results.values())
+        actions = list(results)
+        choices_weights = [q / n + 0.1 * np.sqrt(2 * np.log(total) / n) for q, n in results.values()]
+        action = actions[np.argmax(choices_weights)]
+    else:
+        raise ValueError(f'Unknown parallel mode {mode}')
+
+    elapsed = time.time() - start
+    LAST_STATS.update(mode=mode if pool is not None else 'serial', playouts=playouts,
+                      time=elapsed, playouts_per_sec=playouts / max(elapsed, 1e-9),
+                      nodes=tree.size, bytes_per_node=tree.bytes_per_node())
+    return action, tree
+
+
+def _prepare(prev_board, board, player, remain_time_x, remain_time_y):
+    # the search always plays player 1, the boards are flipped for player -1
+    if player == 1:
+        remain_time = remain_time_x/1000
+    else:
+        board = -np.asarray(board)
+        if prev_board is not None:
+            prev_board = -np.asarray(prev_board)
+        player = 1
+
+        remain_time = remain_time_y/1000
+    remain_time = min(remain_time,TIME_THINKING)
+
+    State_, Problem_ = (BitState, BitProblem) if USE_BITBOARD else (State, Problem)
+    state = State_(board, player)
+    prev_state = State_(prev_board, -player) if prev_board is not None else None
+    problem = Problem_()
+    return prev_state, state, problem, remain_time
+
+
+def move(prev_board, board, player, remain_time_x, remain_time_y, mode=None):
     '''
         Get random move
 
@@ -124,31 +438,79 @@ def move(prev_board, board, player, remain_time_x, remain_time_y):
             player: 1 or -1, represent for player
             remain_time_x: Time remain (ms)
             remain_time_y: Time remain (ms)
+            mode: 'serial', 'root' or 'tree', PARALLEL_MODE if None
         Output
         ----------
             optimize action from all possible action.
             eg. ((1,1),(1,2)).  
     '''
 
-    state = State(board, player)
-    prev_state = State(prev_board, -player) if prev_board is not None else None
-    problem = Problem()
+    prev_state, state, problem, remain_time = _prepare(prev_board, board, player, remain_time_x, remain_time_y)
+    action = mcts(prev_state, state, problem, remain_time, mode)
 
-    if player == 1:
-        remain_time = remain_time_x/1000
-    else:
-        state.board *= -1
-        state.player = 1
-        if prev_state is not None:
-            prev_state.board *= -1
-            prev_state.player = -1
+    return action
 
-        remain_time = remain_time_y/1000
-    remain_time = min(remain_time,TIME_THINKING)
 
-    action = mcts(prev_state, state, problem, remain_time)
+class MCTSBot:
+    def __init__(self, max_nodes=None, mode=None, num_workers=None):
+        '''
+            MCTS player keeping its tree between its moves: the subtree under
+            its last move and the opponent's reply is the root of the next
+            search. Call it like `move`, for one side of one game.
+
+            Input
+            ----------
+                max_nodes: a kept subtree larger than this is dropped, so the
+                           memory held between moves stays bounded.
+            max_nodes, mode, num_workers: MAX_TREE_NODES, PARALLEL_MODE and
+            NUM_WORKERS if None, read at each move.
+        '''
+        self.max_nodes = max_nodes
+        self.mode = mode
+        self.num_workers = num_workers
+        self.reset()
+
+    def reset(self):
+        '''Forget the tree, call it before a new game.'''
+        self.tree = None
+        self.last_action = None
+        self.reused_visits = 0
+
+    def _reuse_tree(self, prev_state, state, problem):
+        # follow our last move then the opponent's one, given by the open move
+        tree, self.tree = self.tree, None
+        if tree is None or prev_state is None:
+            return None
+        our_node = tree.find_child(0, self.last_action)
+        if our_node is None:
+            return None
+        open_move = problem.get_open_move(prev_state, state)
+        if open_move[0] is None or open_move[1] is None:
+            return None
+        node = tree.find_child(our_node, open_move)
+        if node is None or (tree.x[node], tree.o[node]) != _pack(state) \
+                or tree.subtree_size(node) > (MAX_TREE_NODES if self.max_nodes is None else self.max_nodes):
+            return None
+        tree.reroot(node)
+        return tree
+
+    def move(self, prev_board, board, player, remain_time_x, remain_time_y):
+        '''Same as the module\'s move.'''
+        prev_state, state, problem, remain_time = _prepare(prev_board, board, player, remain_time_x, remain_time_y)
+        tree = self._reuse_tree(prev_state, state, problem)
+        self.reused_visits = tree.visits[0] if tree is not None else 0
+
+        action, self.tree = search_tree(prev_state, state, problem, remain_time,
+                                        self.mode, self.num_workers, tree)
+        self.last_action = action
+        return action
+
+    __call__ = move
+
+
+# stateful bot of the registry (mcts_reuse), for callers keeping this process
+BOT = MCTSBot()
 
-    return action
 
 if __name__ == '__main__':
     prev_board = [[-1, 0, -1, 1, 1],
@@ -162,5 +524,7 @@ if __name__ == '__main__':
                 [1, 1,  0,  0, 1],
                 [1, 1, 0, 0, 1]]      
     player = -1
-    a = move(prev_board, board, player, 5000, 5000)
-    print(a)
\ No newline at end of file
+    for mode in ('serial', 'root', 'tree'):
+        get_pool(NUM_WORKERS) # spawn and warm up out of the timing
+        a = move(prev_board, board, player, 5000, 5000, mode)
+        print(a, LAST_STATS)
@@ -0,0 +1,209 @@
+import sys
+import os
+import time
+import random
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from algorithms.problem import State, Problem, check_make_unmake
+from algorithms.bitboard import BitState, BitProblem
+from algorithms import rollout
+
+
+'''
+    Perft: number of move sequences of a given length from a position, the
+    usual check and benchmark of a move generator. Every game core (State/
+    Problem by copy or make/unmake, BitState/BitProblem, the batch engine of
+    rollout.py) must give the counts of the reference, Problem.move by copy.
+    The open move of the position is followed at every ply, so the trap rule
+    is covered.
+
+        python algorithms/perft.py --depth 4
+'''
+
+
+# problem.py's __main__ test case, and the same boards with the colors
+# negated and the other player to move: both must give the same counts
+_TESTCASE_PREV_BOARD = [[-1, 0, -1, 1, 1],
+                        [-1, -1, 0, 0, 1],
+                        [-1, 0, 1, 0, 1],
+                        [1, 1, 0, 0, 1],
+                        [1, 1, 0, 0, 1]]
+_TESTCASE_BOARD = [[-1, 0, 0, 1, -1],
+                   [-1, -1, 0, -1, 1],
+                   [-1, 0, -1, 0, 1],
+                   [1, 1, 0, 0, 1],
+                   [1, 1, 0, 0, 1]]
+
+# name: (prev_board, board, player)
+POSITIONS = {
+    'init': (None, Problem().init_state.board.tolist(), 1),
+    'testcase': (_TESTCASE_PREV_BOARD, _TESTCASE_BOARD, 1),
+    'testcase_swapped': ((-np.array(_TESTCASE_PREV_BOARD)).tolist(), (-np.array(_TESTCASE_BOARD)).tolist(), -1),
+}
+
+# perft of POSITIONS by depth from 1, computed with the reference
+EXPECTED = {
+    'init': [12, 140, 1727, 20196, 254280],
+    'testcase': [10, 95, 921, 8630, 89825],
+    'testcase_swapped': [10, 95, 921, 8630, 89825],
+}
+
+
+def random_positions(num_positions=4, num_plies=(8, 16, 24, 32), random_state=45):
+    '''
+        Positions of seeded random games, after each of num_plies moves,
+        as POSITIONS (prev_board, board, player), some with a trap.
+    '''
+    problem = Problem()
+    rng = random.Random(random_state)
+    positions = {}
+    game = 0
+    while len(positions) < num_positions:
+        prev_state, state = None, problem.init_state.copy()
+        for ply in range(1, max(num_plies) + 1):
+            dict_possible_moves = problem.get_possible_moves(prev_state, state)
+            if not dict_possible_moves:
+                break
+            start = rng.choice(sorted(dict_possible_moves))
+            prev_state, state = state, problem.move(state, (start, rng.choice(dict_possible_moves[start])))
+            if ply in num_plies and state.check_winning_state() == 0 and len(positions) < num_positions:
+                positions[f'random_{game}_{ply}'] = (prev_state.board.tolist(), state.board.tolist(), state.player)
+        game += 1
+    return positions
+
+
+def perft_copy(problem, state, depth, action=None):
+    '''Perft by problem.move, a new state per node (the reference).'''
+    dict_possible_moves = problem.get_possible_moves_after(state, action)
+    if depth == 1:
+        return sum(len(ends) for ends in dict_possible_moves.values())
+    nodes = 0
+    for start, ends in dict_possible_moves.items():
+        for end in ends:
+            nodes += perft_copy(problem, problem.move(state, (start, end)), depth - 1, (start, end))
+    return nodes
+
+
+def perft_make(problem, state, depth, action=None):
+    '''Perft by make_move/unmake_move on one state.'''
+    dict_possible_moves = problem.get_possible_moves_after(state, action)
+    if depth == 1:
+        return sum(len(ends) for ends in dict_possible_moves.values())
+    nodes = 0
+    for start, ends in dict_possible_moves.items():
+        for end in ends:
+            record = problem.make_move(state, (start, end))
+            nodes += perft_make(problem, state, depth - 1, (start, end))
+            problem.unmake_move(state, record)
+    return nodes
+
+
+def perft_batch(board, player, action=None, depth=1):
+    '''
+        Perft by the batch engine of rollout.py, breadth first: all the
+        positions of a ply are expanded with a few array operations.
+    '''
+    boards = (np.asarray(board, dtype=np.int8).reshape(1, rollout.SIZE) * player).astype(np.int8)
+    open_points = np.full(1, rollout.NO_POINT)
+    if action is not None and action[0] is not None:
+        open_points[:] = action[0][0] * rollout.WIDTH + action[0][1]
+    for ply in range(depth):
+        games, moves = np.nonzero(rollout.legal_moves(boards, open_points))
+        if ply == depth - 1:
+            return len(moves)
+        boards = boards[games]
+        rollout.apply_moves(boards, moves)
+        boards = -boards
+        open_points = rollout.MOVE_START[moves]
+    return len(boards)
+
+
+def divide(problem, state, depth, action=None):
+    '''Perft below each root move, to find the move where two engines differ.'''
+    counts = {}
+    for start, ends in problem.get_possible_moves_after(state, action).items():
+        for end in ends:
+            next_state = problem.move(state, (start, end))
+            counts[(start, end)] = perft_copy(problem, next_state, depth - 1, (start, end)) if depth > 1 else 1
+    return counts
+
+
+def _engines():
+    # name: perft(prev_board, board, player, depth)
+    def by_problem(problem, State_, perft):
+        def run(prev_board, board, player, depth):
+            state = State_(board, player)
+            prev_state = State_(prev_board, -player) if prev_board is not None else None
+            return perft(problem, state, depth, problem.get_open_move(prev_state, state))
+        return run
+
+    def batch(prev_board, board, player, depth):
+        problem = Problem()
+        state = State(board, player)
+        prev_state = State(prev_board, -player) if prev_board is not None else None
+        return perft_batch(board, player, problem.get_open_move(prev_state, state), depth)
+
+    return {
+        'problem_copy': by_problem(Problem(), State, perft_copy),
+        'problem_make': by_problem(Problem(), State, perft_make),
+        'bitboard_copy': by_problem(BitProblem(), BitState, perft_copy),
+        'bitboard_make': by_problem(BitProblem(), BitState, perft_make),
+        'batch': batch,
+    }
+
+ENGINES = _engines()
+REFERENCE = 'problem_copy'
+
+
+def run(positions=None, depth=3, engines=None):
+    '''
+        Perft of every position to `depth` with every engine, checked
+        against the reference (and EXPECTED when it goes that deep).
+
+        Output
+        ----------
+            {engine: (nodes, seconds)} summed over positions and depths.
+    '''
+    positions = positions or POSITIONS
+    engines = engines or list(ENGINES)
+    totals = {name: [0, 0.0] for name in engines}
+    for position, (prev_board, board, player) in positions.items():
+        for d in range(1, depth + 1):
+            counts = {}
+            for name in [REFERENCE] + [name for name in engines if name != REFERENCE]:
+                start = time.time()
+                counts[name] = ENGINES[name](prev_board, board, player, d)
+                if name in totals:
+                    totals[name][0] += counts[name]
+                    totals[name][1] += time.time() - start
+            expected = EXPECTED.get(position, [])
+            reference = expected[d - 1] if d <= len(expected) else counts[REFERENCE]
+            wrong = {name: count for name, count in counts.items() if count != reference}
+            if wrong:
+                raise AssertionError(f'perft({position}, {d}) = {reference}, got {wrong}')
+            print(f'{position:18s} depth {d}: {reference:10d}')
+    return {name: tuple(total) for name, total in totals.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perft check and benchmark of the game cores.')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--random', type=int, default=4, help='positions of random games added')
+    parser.add_argument('--properties', action='store_true',
+                        help='also run check_make_unmake and check_batch_engine')
+    args = parser.parse_args()
+
+    positions = dict(POSITIONS, **random_positions(args.random))
+    totals = run(positions, args.depth, args.engines)
+    print()
+    for name, (nodes, seconds) in totals.items():
+        print(f'{name:14s} {nodes:10d} nodes {seconds:7.2f}s {nodes / max(seconds, 1e-9):11.0f} nodes/s')
+
+    if args.properties:
+        for engine in (Problem(), BitProblem()):
+            print(f'{type(engine).__name__}: make/unmake restored {check_make_unmake(engine, 100000)} moves')
+        rollout.check_batch_engine()
@@ -1,11 +1,16 @@
-from collections import deque
+from collections import deque, namedtuple
 import copy
+import random
 import time
 
 import numpy as np
 
 def _move_AI_bounder(prev_board, board, player, remain_time_x, remain_time_y,algorithm,return_queue):
     # move = algorithm(board, player, remain_time_x, remain_time_y)
+    if isinstance(algorithm, str):
+        # registry name, the bot is imported here (in the AI process)
+        from algorithms import get_algorithm
+        algorithm = get_algorithm(algorithm)
     start_time = time.time()
     move = algorithm(prev_board, board, player, remain_time_x, remain_time_y)
     end_time = time.time()
@@ -19,6 +24,16 @@ class State:
         self.height = self.board.shape[0]
         self.width = self.board.shape[1]
 
+        # Zobrist key of board, player and open point (see Problem.make_move),
+        # kept up to date by make_move/unmake_move
+        piece_keys, _, player_key = get_zobrist_keys(self.height, self.width)
+        self.key = player_key if player == -1 else 0
+        for coor_y, row in enumerate(self.board.tolist()):
+            for coor_x, value in enumerate(row):
+                if value != 0:
+                    self.key ^= piece_keys[value][(coor_y, coor_x)]
+        self.open_point = None
+
     def __eq__(self, other):
         return np.array_equal(self.board,other.board) \
             and self.player == other.player
@@ -34,12 +49,19 @@ class State:
         return f'Board: {str_board}\nPlayer\'s turn: {str_player}'
     
     def __hash__(self):
-        hash_value = ''
-        for coor_y in range(self.height):
-            for coor_x in range(self.width):
-                hash_value +=   chr(98+self.board[coor_y][coor_x])
-        hash_value += chr(98+self.player)
-        return hash(hash_value)
+        # equality ignores the open point, so must the hash
+        if self.open_point is None:
+            return hash(self.key)
+        return hash(self.key ^ get_zobrist_keys(self.height, self.width)[1][self.open_point])
+
+    def copy(self):
+        state = copy.copy(self)
+        state.board = self.board.copy()
+        return state
+
+    def material(self):
+        # number of X pieces minus number of O pieces
+        return np.sum(self.board)
 
     def check_winning_state(self):
         # return: one of below:
@@ -53,6 +75,73 @@ class State:
             result = 1
         return result
 
+_BOARD_TABLES = {}
+
+def get_board_tables(height: int, width: int):
+    '''
+    Static tables of a board geometry, built once and shared by every Problem.
+
+    Output
+    ----------
+        neighbors: dict position -> tuple of connected positions.
+        is_diagonal: dict position -> True if the position has diagonal lines.
+        capture_pairs: dict position -> tuple of (a, b) position pairs which
+                       flank the position on a line (used for ganh and trap).
+    '''
+    if (height, width) not in _BOARD_TABLES:
+        neighbors = {}
+        is_diagonal = {}
+        capture_pairs = {}
+        on_board = lambda y, x: 0 <= y < height and 0 <= x < width
+        for coor_y in range(height):
+            for coor_x in range(width):
+                pos = (coor_y, coor_x)
+                is_diagonal[pos] = (coor_y + coor_x) % 2 == 0
+                steps = ((1, 0), (-1, 0), (0, 1), (0, -1))
+                if is_diagonal[pos]:
+                    steps += ((1, 1), (-1, 1), (1, -1), (-1, -1))
+
+                neighbors[pos] = tuple((coor_y + step_y, coor_x + step_x) for step_y, step_x in steps
+                                       if on_board(coor_y + step_y, coor_x + step_x))
+                capture_pairs[pos] = tuple(((coor_y + step_y, coor_x + step_x), (coor_y - step_y, coor_x - step_x))
+                                           for step_y, step_x in steps
+                                           if (step_y, step_x) > (-step_y, -step_x)
+                                           and on_board(coor_y + step_y, coor_x + step_x)
+                                           and on_board(coor_y - step_y, coor_x - step_x))
+        _BOARD_TABLES[(height, width)] = (neighbors, is_diagonal, capture_pairs)
+    return _BOARD_TABLES[(height, width)]
+
+
+# Everything unmake_move needs to take back one move:
+#   action: the move (start, end) that was made
+#   piece: value of the moved piece
+#   flipped: positions of the opponent's pieces flipped by ganh or chet
+#   player: player who made the move
+#   key, open_point: Zobrist key and open point of the state before the move
+UndoRecord = namedtuple('UndoRecord', ['action', 'piece', 'flipped', 'player', 'key', 'open_point'])
+
+
+_ZOBRIST_KEYS = {}
+
+def get_zobrist_keys(height: int, width: int):
+    '''
+    Random 64-bit keys of a board geometry, the same on every run.
+
+    Output
+    ----------
+        piece_keys: dict player -> dict position -> key.
+        open_keys: dict position -> key of an open point (trap).
+        player_key: key xor-ed in when player -1 is to move.
+    '''
+    if (height, width) not in _ZOBRIST_KEYS:
+        rng = random.Random(45)
+        positions = [(coor_y, coor_x) for coor_y in range(height) for coor_x in range(width)]
+        piece_keys = {player: {pos: rng.getrandbits(64) for pos in positions} for player in (1, -1)}
+        open_keys = {pos: rng.getrandbits(64) for pos in positions}
+        _ZOBRIST_KEYS[(height, width)] = (piece_keys, open_keys, rng.getrandbits(64))
+    return _ZOBRIST_KEYS[(height, width)]
+
+
 class Problem:
     def __init__(self):
         self.init_state = State(
@@ -63,6 +152,10 @@ class Problem:
                    [-1, -1, -1, -1, -1]],
             player = 1
         )
+        self.neighbors, self.is_diagonal, self.capture_pairs = \
+            get_board_tables(self.init_state.height, self.init_state.width)
+        self.piece_keys, self.open_keys, self.player_key = \
+            get_zobrist_keys(self.init_state.height, self.init_state.width)
 
     def get_open_move(self, prev_state:State, state:State):
         '''Get open move for given state
@@ -97,34 +190,28 @@ class Problem:
             and coor[1] % state.width == coor[1]
 
     def get_valid_neighbors(self, state: State, pos: tuple):
-        coor_y, coor_x = pos
-        possible_neighbors = ((coor_y + 1, coor_x), (coor_y - 1, coor_x), (coor_y, coor_x + 1), (coor_y, coor_x - 1))
-        if ((coor_x + coor_y) % 2 == 0):
-            possible_neighbors += ((coor_y + 1, coor_x + 1), (coor_y - 1, coor_x + 1), (coor_y + 1, coor_x - 1), (coor_y - 1, coor_x - 1))
-        return [coor for coor in possible_neighbors if self.is_on_board(state, coor)]        
+        return self.neighbors[pos]
 
     def can_move(self, state: State, pos: tuple):
-        neighbor = self.get_valid_neighbors(state, pos)
-        can_move_list = []
-        for value in neighbor:
-            if state.board[value] == 0:
-                can_move_list.append(value)
-        return can_move_list 
+        board = state.board
+        return [value for value in self.neighbors[pos] if board[value] == 0]
 
     def capture(self, state: State, pos_action: tuple):
-        player = state.board[pos_action[0]][pos_action[1]]
-        coor_y, coor_x = pos_action
+        board = state.board
+        opponent = -board[pos_action]
         capture_list = []
-        flat_coor = coor_y * state.width + coor_x
-        neighbor = self.get_valid_neighbors(state, pos_action)
-        for pos in neighbor:
-            flat_pos = pos[0] * state.width + pos[1]
-            if state.board[pos[0]][pos[1]] == -player:
-                opposite_pos = divmod(flat_coor*2 - flat_pos, state.width)
-                if opposite_pos in neighbor:
-                    if state.board[opposite_pos[0]][opposite_pos[1]] == -player:
-                        capture_list.append(pos)
-        return capture_list                
+        for pos_a, pos_b in self.capture_pairs[pos_action]:
+            if board[pos_a] == opponent and board[pos_b] == opponent:
+                capture_list += (pos_a, pos_b)
+        return capture_list
+
+    def is_flanked(self, state: State, pos: tuple, player: int):
+        '''True if `pos` lies between two pieces of `player` on a line.'''
+        board = state.board
+        for pos_a, pos_b in self.capture_pairs[pos]:
+            if board[pos_a] == player and board[pos_b] == player:
+                return True
+        return False
 
     def get_possible_moves(self, prev_state: State, state:State):
         '''
@@ -144,7 +231,19 @@ class Problem:
                             ...
                            }
         '''
-        action = self.get_open_move(prev_state, state)
+        return self.get_possible_moves_after(state, self.get_open_move(prev_state, state))
+
+    def get_possible_moves_after(self, state: State, action):
+        '''
+        Same as get_possible_moves but take the open move directly, so a search
+        walking one board with make_move/unmake_move can pass the last action.
+
+        Input
+        ----------
+            state: input State.
+            action: (prev_action, now_action) of the opponent's last move as
+                    returned by get_open_move, None if unknown.
+        '''
         dictionary = dict({})
         for coor_y in range(state.height):
             for coor_x in range(state.width):
@@ -155,22 +254,9 @@ class Problem:
         trap_move = dict({})
         if action is not None:
             # print(f"Action {action[0]} --> {action[1]}")
-            neighbor = self.get_valid_neighbors(state, action[0])
-            for value in neighbor:
-                if state.board[value] == state.player:
-                    is_cap = False
-                    flat_player = action[0][0] * state.width + action[0][1]
-                    for pos in neighbor:
-                        if pos == value:
-                            continue
-                        if state.board[pos] == -state.player:
-                            flat_pos = pos[0] * state.width + pos[1]
-                            opposite_pos = divmod(flat_player * 2 - flat_pos, state.width)
-                            if opposite_pos in neighbor:
-                                if state.board[opposite_pos] == -state.player:
-                                    is_cap = True
-                                    break
-                    if is_cap:
+            if self.is_flanked(state, action[0], -state.player):
+                for value in self.neighbors[action[0]]:
+                    if state.board[value] == state.player:
                         trap_move[value] = [action[0]]
             if (len(trap_move) == 0):
                 return dictionary
@@ -196,37 +282,98 @@ class Problem:
             
         '''
         if not inplace:
-            state = copy.deepcopy(state)
-        state.board[action[1]] = state.board[action[0]]
-        state.board[action[0]] = 0
-        capture_list = self.capture(state, action[1])
-        for pos in capture_list:
-            state.board[pos] = state.player
+            state = state.copy()
+        self.make_move(state, action)
+
+        if not inplace:
+            return state
+
+    def make_move(self, state: State, action):
+        '''
+        Do action in place and return what is needed to take it back.
+        state.key is updated by xor: the moved piece, every flipped piece, the
+        player to move and the open point. The open point (the point just
+        left) only enters the key when it traps the next player, since only
+        then does it change the possible moves.
+
+        Input
+        ----------
+            state: input State, modified in place.
+            action: eg. ((1,1),(1,2)).
+
+        Output
+        ----------
+            record: UndoRecord to pass to unmake_move.
+        '''
+        board = state.board
+        piece = board[action[0]]
+        board[action[1]] = piece
+        board[action[0]] = 0
+        flipped = self.capture(state, action[1])
+        for pos in flipped:
+            board[pos] = state.player
+        record_key, record_open_point = state.key, state.open_point
 
         q = deque()
-        liberty_table = copy.deepcopy(state.board)
+        liberty_table = board.tolist()
         for coor_y in range(state.height):
             for coor_x in range(state.width):
-                if (state.board[coor_y, coor_x] == 0):
+                if (liberty_table[coor_y][coor_x] == 0):
                     q.append((coor_y, coor_x))
-                    liberty_table[coor_y, coor_x] = 3
 
         while (len(q) > 0):
             cur = q.popleft()
-            neighbor = self.get_valid_neighbors(state, cur)
-            for value in neighbor:
-                if liberty_table[value] == -state.player:
-                    liberty_table[value] = 3
+            for value in self.neighbors[cur]:
+                if liberty_table[value[0]][value[1]] == -state.player:
+                    liberty_table[value[0]][value[1]] = 3
                     q.append(value)
-        
+
         for coor_y in range(state.height):
             for coor_x in range(state.width):
-                if (liberty_table[coor_y, coor_x] == -state.player):
-                    state.board[coor_y, coor_x] = state.player        
+                if (liberty_table[coor_y][coor_x] == -state.player):
+                    board[coor_y, coor_x] = state.player
+                    flipped.append((coor_y, coor_x))
+
+        own_keys, opp_keys = self.piece_keys[state.player], self.piece_keys[-state.player]
+        key = state.key ^ self.piece_keys[piece][action[0]] ^ self.piece_keys[piece][action[1]] ^ self.player_key
+        for pos in flipped:
+            key ^= own_keys[pos] ^ opp_keys[pos]
+        state.key = key
+
+        record = UndoRecord(action, piece, flipped, state.player, record_key, record_open_point)
         state.player *= -1
+        self.set_open_move(state, action)
+        return record
 
-        if not inplace:
-            return state
+    def set_open_move(self, state: State, action):
+        '''
+        Record in state.open_point (and state.key) the open point left by
+        `action`, the opponent's last move. The point is kept only if it traps
+        the player to move. Call it on a state built from a board to give it
+        the same key as if it had been reached by make_move.
+        '''
+        if state.open_point is not None:
+            state.key ^= self.open_keys[state.open_point]
+            state.open_point = None
+        if action is None or action[0] is None:
+            return
+        if self.is_flanked(state, action[0], -state.player):
+            for value in self.neighbors[action[0]]:
+                if state.board[value] == state.player:
+                    state.open_point = action[0]
+                    state.key ^= self.open_keys[action[0]]
+                    break
+
+    def unmake_move(self, state: State, record: UndoRecord):
+        '''Take back the move described by `record` (returned by make_move).'''
+        board = state.board
+        board[record.action[0]] = record.piece
+        board[record.action[1]] = 0
+        for pos in record.flipped:
+            board[pos] = -record.player
+        state.player = record.player
+        state.key = record.key
+        state.open_point = record.open_point
 
     def move_if_possible(self, prev_state:State, state:State, action, inplace=False):
         '''
@@ -262,7 +409,49 @@ def print_board(board: list):
             else:
                 row += "- "
         print(row)
-        
+
+
+def check_make_unmake(problem, num_moves=1000000, random_state=45):
+    '''
+        Property check of make_move/unmake_move: along random games, every
+        possible move is made and taken back, and the state must be restored
+        exactly and match the result of problem.move, with a Zobrist key
+        equal to the one computed from scratch.
+
+        Output
+        ----------
+            number of checked moves.
+    '''
+    rng = random.Random(random_state)
+    checked = 0
+    while checked < num_moves:
+        state = problem.init_state.copy()
+        last_action = None
+        while state.check_winning_state() == 0 and checked < num_moves:
+            dict_possible_moves = problem.get_possible_moves_after(state, last_action)
+            all_possible_moves = [(start, end) for start, ends in dict_possible_moves.items() for end in ends]
+
+            before = state.copy()
+            for action in all_possible_moves:
+                expected = problem.move(state, action)
+                record = problem.make_move(state, action)
+                if not state == expected or state.key != expected.key:
+                    raise AssertionError(f'make_move {action} differs from move:\n{before}')
+                fresh_key = type(state)(state.board, state.player).key
+                if state.open_point is not None:
+                    fresh_key ^= get_zobrist_keys(state.height, state.width)[1][state.open_point]
+                if state.key != fresh_key:
+                    raise AssertionError(f'make_move {action} has a wrong key:\n{before}')
+                problem.unmake_move(state, record)
+                if not state == before or state.key != before.key or state.open_point != before.open_point:
+                    raise AssertionError(f'unmake_move {action} did not restore:\n{before}')
+                checked += 1
+
+            last_action = rng.choice(all_possible_moves)
+            problem.make_move(state, last_action)
+    return checked
+
+
 if __name__ == '__main__':
     # Test Space
     testcase = {
@@ -302,3 +491,11 @@ if __name__ == '__main__':
         print(game.get_open_move(prev_state, state))
     else:
         print("Nuoc di mo:", game.get_possible_moves(None, state))
+
+    # make_move/unmake_move property check, for both game cores
+    import sys, os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from algorithms.bitboard import BitProblem
+    for engine in (game, BitProblem()):
+        num_moves = check_make_unmake(engine)
+        print(f'{type(engine).__name__}: make/unmake restored {num_moves} moves')
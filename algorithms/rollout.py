@@ -0,0 +1,238 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from algorithms.problem import get_board_tables
+
+
+'''
+    Batch rollout engine: K random games are played at once on a (K, 25)
+    int8 array, one row per game, from the side of the player to move
+    (own pieces are 1, the opponent's -1; the rows are negated after each
+    ply). A ply is a few array operations over all the games.
+'''
+
+
+HEIGHT = 5
+WIDTH = 5
+SIZE = HEIGHT * WIDTH
+MAX_DEPTH = 7
+NO_POINT = SIZE # open point of a game without one
+
+_neighbors, _, _capture_pairs = get_board_tables(HEIGHT, WIDTH)
+_coors = [divmod(index, WIDTH) for index in range(SIZE)]
+
+# ADJACENCY[i, j]: points i and j are connected
+ADJACENCY = np.zeros((SIZE, SIZE), dtype=np.int8)
+for _index, _pos in enumerate(_coors):
+    for _pos_y, _pos_x in _neighbors[_pos]:
+        ADJACENCY[_index, _pos_y * WIDTH + _pos_x] = 1
+
+# every directed move (start, end) along a line, 112 on the 5*5 board
+MOVE_START, MOVE_END = (np.array(points) for points in zip(*np.argwhere(ADJACENCY)))
+NUM_MOVES = len(MOVE_START)
+# START_ONE_HOT[m, i]: move m starts at point i
+START_ONE_HOT = (MOVE_START[:, None] == np.arange(SIZE)).astype(np.int16)
+
+# PAIR_A[i, p], PAIR_B[i, p]: p-th pair flanking point i, padded with NO_POINT
+# (a column that is always empty, see _padded) up to the largest count. Row
+# NO_POINT has no pair, so games without an open point are never trapped.
+MAX_PAIRS = max(len(pairs) for pairs in _capture_pairs.values())
+PAIR_A = np.full((SIZE + 1, MAX_PAIRS), NO_POINT)
+PAIR_B = np.full((SIZE + 1, MAX_PAIRS), NO_POINT)
+for _index, _pos in enumerate(_coors):
+    for _p, ((_a_y, _a_x), (_b_y, _b_x)) in enumerate(_capture_pairs[_pos]):
+        PAIR_A[_index, _p] = _a_y * WIDTH + _a_x
+        PAIR_B[_index, _p] = _b_y * WIDTH + _b_x
+
+
+def _padded(boards):
+    # extra always empty column, the target of the padding of PAIR_A/PAIR_B
+    return np.concatenate([boards, np.zeros((len(boards), 1), dtype=boards.dtype)], axis=1)
+
+
+def legal_moves(boards, open_points):
+    '''
+        Legal moves of the player to move in every game.
+
+        Input
+        ----------
+            boards: (K, 25) int8, from the side of the player to move.
+            open_points: (K,) point the opponent just left, NO_POINT if none.
+
+        Output
+        ----------
+            legal: (K, NUM_MOVES) bool, legal[k, m] if move m is legal in game k,
+                   same moves as Problem.get_possible_moves_after.
+    '''
+    legal = (boards[:, MOVE_START] == 1) & (boards[:, MOVE_END] == 0)
+
+    # trap: the open point is flanked by the opponent, own neighbours must go there
+    padded = _padded(boards)
+    rows = np.arange(len(boards))[:, None]
+    flanked = ((padded[rows, PAIR_A[open_points]] == -1)
+               & (padded[rows, PAIR_B[open_points]] == -1)).any(axis=1)
+    trap = legal & (MOVE_END[None, :] == open_points[:, None])
+    trapped = flanked & trap.any(axis=1)
+    legal[trapped] = trap[trapped]
+    return legal
+
+
+def choose_moves(legal, rng):
+    '''
+        One random legal move per game, the start point is drawn first then
+        the end point, like the rollout of mcts_base.
+
+        Output
+        ----------
+            moves: (K,) index of the chosen move, -1 for games without one.
+    '''
+    legal = legal.astype(np.int16)
+    ends_per_start = legal @ START_ONE_HOT # (K, 25)
+    starts = (ends_per_start > 0).sum(axis=1)
+    weights = legal / np.maximum(ends_per_start[:, MOVE_START], 1) # 1/ends of the start
+    cumulative = np.cumsum(weights, axis=1)
+    draws = rng.random(len(legal)) * cumulative[:, -1]
+    moves = (cumulative <= draws[:, None]).sum(axis=1)
+    moves = np.minimum(moves, NUM_MOVES - 1) # guards the rounding of the last draw
+    moves[starts == 0] = -1
+    return moves
+
+
+def apply_moves(boards, moves):
+    '''
+        Play moves[k] in game k (all moves must be legal), in place: the
+        destination flips the flanking opponent pairs (ganh), then every
+        opponent group without a path to an empty point is flipped (chet).
+        Boards stay from the side of the player who moved.
+    '''
+    rows = np.arange(len(boards))
+    ends = MOVE_END[moves]
+    boards[rows, MOVE_START[moves]] = 0
+    boards[rows, ends] = 1
+
+    padded = _padded(boards)
+    pair_a, pair_b = PAIR_A[ends], PAIR_B[ends]
+    captured = (padded[rows[:, None], pair_a] == -1) & (padded[rows[:, None], pair_b] == -1)
+    padded[rows[:, None], np.where(captured, pair_a, NO_POINT)] = 1
+    padded[rows[:, None], np.where(captured, pair_b, NO_POINT)] = 1
+    boards[:] = padded[:, :SIZE]
+
+    # flood the opponent from the empty points, what is not reached is dead
+    opponent = boards == -1
+    alive = np.zeros_like(opponent)
+    frontier = boards == 0
+    while frontier.any():
+        frontier = ((frontier.astype(np.int8) @ ADJACENCY) > 0) & opponent & ~alive
+        alive |= frontier
+    boards[opponent & ~alive] = 1
+
+
+def batch_rollout(boards, player, open_point=None, num_games=None, max_depth=MAX_DEPTH, rng=None):
+    '''
+        Play random games until they end or max_depth moves are played.
+
+        Input
+        ----------
+            boards: (K, 5, 5) or one (5, 5) board, played num_games times.
+            player: 1 or -1, player to move in every game.
+            open_point: (y, x) the opponent just left, as get_open_move()[0].
+            rng: numpy Generator.
+
+        Output
+        ----------
+            results: (K,) int8, sign of the material at the end (1: player 1
+                     ahead), same as the rollout of mcts_base.
+    '''
+    rng = rng or np.random.default_rng()
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, SIZE)
+    if num_games is not None:
+        boards = np.repeat(boards, num_games, axis=0)
+    boards = boards * np.int8(player)
+    open_points = np.full(len(boards), NO_POINT)
+    if open_point is not None:
+        open_points[:] = open_point[0] * WIDTH + open_point[1]
+
+    sides = np.full(len(boards), player, dtype=np.int8) # player to move in each game
+    active = np.ones(len(boards), dtype=bool)
+    for _ in range(max_depth):
+        active &= (boards == 1).any(axis=1) & (boards == -1).any(axis=1)
+        games = np.flatnonzero(active)
+        if not len(games):
+            break
+        moves = choose_moves(legal_moves(boards[games], open_points[games]), rng)
+        active[games[moves < 0]] = False # no legal move, the game stops here
+        games, moves = games[moves >= 0], moves[moves >= 0]
+
+        played = boards[games]
+        apply_moves(played, moves)
+        boards[games] = -played
+        sides[games] *= -1
+        open_points[games] = MOVE_START[moves]
+
+    material = boards.sum(axis=1, dtype=np.int16) * sides
+    return np.sign(material).astype(np.int8)
+
+
+def check_batch_engine(num_positions=2000, random_state=45):
+    '''
+        Compare legal_moves/apply_moves with Problem on the positions of
+        random games, every legal move of every position is played.
+    '''
+    import random
+    from algorithms.problem import Problem
+
+    problem = Problem()
+    rng = random.Random(random_state)
+    move_index = {(_coors[start], _coors[end]): m for m, (start, end) in enumerate(zip(MOVE_START, MOVE_END))}
+    state, last_action = problem.init_state.copy(), None
+    for _ in range(num_positions):
+        if state.check_winning_state() != 0:
+            state, last_action = problem.init_state.copy(), None
+        dict_possible_moves = problem.get_possible_moves_after(state, last_action)
+        expected = {move_index[(start, end)] for start, ends in dict_possible_moves.items() for end in ends}
+
+        board = (state.board.reshape(1, SIZE) * state.player).astype(np.int8)
+        open_point = NO_POINT if last_action is None else last_action[0][0] * WIDTH + last_action[0][1]
+        legal = legal_moves(board, np.array([open_point]))[0]
+        assert set(np.flatnonzero(legal).tolist()) == expected, (state, last_action)
+
+        moves = np.array(sorted(expected))
+        boards = np.repeat(board, len(moves), axis=0)
+        apply_moves(boards, moves)
+        for m, next_board in zip(moves, boards):
+            next_state = problem.move(state, (_coors[MOVE_START[m]], _coors[MOVE_END[m]]))
+            assert (next_board * state.player == next_state.board.reshape(-1)).all(), (state, m)
+
+        if not dict_possible_moves:
+            state, last_action = problem.init_state.copy(), None
+            continue
+        start = rng.choice(list(dict_possible_moves))
+        last_action = (start, rng.choice(dict_possible_moves[start]))
+        problem.make_move(state, last_action)
+    print(f'batch engine matches Problem on {num_positions} positions')
+
+
+if __name__ == '__main__':
+    check_batch_engine()
+
+    # playouts/s of the rollout of mcts_base against batches of K games
+    from algorithms.problem import Problem
+    from algorithms.mcts_base import rollout
+    problem = Problem()
+    state = problem.init_state
+    start = time.time()
+    for _ in range(2000):
+        rollout(problem, state, None)
+    print(f'mcts_base rollout: {2000 / (time.time() - start):9.0f} playouts/s')
+    rng = np.random.default_rng(45)
+    for num_games in (1, 32, 256, 1024):
+        start = time.time()
+        repeats = max(1, 4096 // num_games)
+        for _ in range(repeats):
+            results = batch_rollout(state.board, state.player, num_games=num_games, rng=rng)
+        print(f'batch of {num_games:4d}: {num_games * repeats / (time.time() - start):9.0f} playouts/s'
+              f'  (mean result {results.mean():+.3f})')
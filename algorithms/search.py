@@ -0,0 +1,188 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms import tt
+
+
+'''
+    Alpha-beta search shared by the time-managed bots: epsilon's minimax
+    (material evaluation, moves ordered by score) walking one board with
+    make_move/unmake_move, a transposition table and a clock it can abort on.
+'''
+
+
+WIN_SCORE = 1000
+CHECK_TIME_EVERY = 256 # nodes between two clock checks
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TimeManager:
+    def __init__(self, remain_time, moves_left, max_time):
+        '''
+            Split the remaining clock evenly over the remaining moves.
+
+            Input
+            ----------
+                remain_time: time left on our clock (s).
+                moves_left: moves we still have to play.
+                max_time: upper bound of the budget of one move (s).
+        '''
+        self.start_time = time.time()
+        self.budget = max(0.0, min(max_time, remain_time / max(1, moves_left)))
+        self.deadline = self.start_time + self.budget
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def is_over(self):
+        return time.time() >= self.deadline
+
+    def can_start_iteration(self, last_iteration_time):
+        # the next iteration costs a few times the last one, do not start it
+        # if it obviously cannot finish
+        return self.elapsed() + 2 * last_iteration_time < self.budget
+
+
+class Searcher:
+    def __init__(self, problem, table, time_manager=None, max_nodes=None):
+        self.problem = problem
+        self.table = table
+        self.time_manager = time_manager
+        self.max_nodes = max_nodes
+
+        self.nodes = 0
+        self.cutoffs = 0
+
+    def _check_limits(self):
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        if self.time_manager is not None and self.time_manager.is_over():
+            raise SearchTimeout()
+
+    def order_moves(self, state, dict_possible_moves, hint_move=None):
+        '''All moves of `dict_possible_moves`, best first for state.player.'''
+        problem = self.problem
+        moves_info = []
+        for start, possible_ends in dict_possible_moves.items():
+            for end in possible_ends:
+                next_move = (start, end)
+                record = problem.make_move(state, next_move)
+                moves_info.append((state.material(), next_move))
+                problem.unmake_move(state, record)
+
+        if state.player == 1:
+            moves_info.sort(key=lambda x: (x[1] == hint_move, x[0]), reverse=True) # hint first, then by score
+        else:
+            moves_info.sort(key=lambda x: (x[1] != hint_move, x[0]), reverse=False) # hint first, then by score
+        return [next_move for _, next_move in moves_info]
+
+    def minimax(self, last_action, state, depth, alpha, beta, root_moves=None):
+        '''
+            Minimax value of `state` (player 1 maximizes), state is walked
+            with make_move/unmake_move and is left unchanged unless the search
+            is aborted with SearchTimeout.
+
+            Output
+            ----------
+                (best_move, score), best_move is None on terminal/leaf nodes.
+        '''
+        self.nodes += 1
+        if self.nodes % CHECK_TIME_EVERY == 0:
+            self._check_limits()
+
+        winner = state.check_winning_state()
+        if winner != 0:
+            return None, WIN_SCORE*winner
+
+        if depth == 0:
+            return None, state.material()
+
+        hint_move = None
+        entry = self.table.probe(state.key)
+        if entry is not None:
+            score = tt.get_cutoff(entry, depth, alpha, beta)
+            if score is not None and entry[tt.MOVE] is not None and root_moves is None:
+                return entry[tt.MOVE], score
+            hint_move = entry[tt.MOVE]
+        alpha_orig, beta_orig = alpha, beta
+
+        if root_moves is None:
+            dict_possible_moves = self.problem.get_possible_moves_after(state, last_action)
+            next_moves = self.order_moves(state, dict_possible_moves, hint_move)
+        else:
+            next_moves = sorted(root_moves, key=lambda x: x != hint_move)
+
+        problem = self.problem
+        best_move = next_moves[0] if next_moves else None
+        best_score = -WIN_SCORE if state.player == 1 else WIN_SCORE
+        for next_move in next_moves:
+            record = problem.make_move(state, next_move)
+            _, value = self.minimax(next_move, state, depth-1, alpha, beta)
+            problem.unmake_move(state, record)
+
+            if state.player == 1:
+                if value > best_score:
+                    best_score = value
+                    best_move = next_move
+                alpha = max(alpha, best_score)
+            else:
+                if value < best_score:
+                    best_score = value
+                    best_move = next_move
+                beta = min(beta, best_score)
+
+            if beta <= alpha:
+                self.cutoffs += 1
+                break
+
+        self.table.store(state.key, depth, best_score, tt.get_flag(best_score, alpha_orig, beta_orig), best_move)
+        return best_move, best_score
+
+
+def iterative_deepening(searcher, state, open_move, max_depth, time_manager=None, root_moves=None):
+    '''
+        Search depth 1, 2, ... until `max_depth`, the clock or the node budget
+        runs out, the move of the deepest completed iteration is kept.
+
+        Input
+        ----------
+            searcher: Searcher, its limits abort the running iteration.
+            state: root State (or BitState), open move already set.
+            open_move: opponent's last move, as returned by get_open_move.
+            root_moves: restrict the root to these moves, all if None.
+
+        Output
+        ----------
+            (best_move, score, depth): depth is the deepest completed
+            iteration, 0 if not even depth 1 finished (best_move is then the
+            first possible move). best_move is None when the side to move
+            has no move.
+    '''
+    state = state.copy()
+    if root_moves is None:
+        root_moves = searcher.order_moves(
+            state, searcher.problem.get_possible_moves_after(state, open_move))
+    if not root_moves:
+        return None, -WIN_SCORE if state.player == 1 else WIN_SCORE, 0
+    best_move, best_score, completed_depth = root_moves[0], 0, 0
+
+    for depth in range(1, max_depth+1):
+        iteration_start = time.time()
+        try:
+            next_move, score = searcher.minimax(open_move, state, depth, -WIN_SCORE, WIN_SCORE, root_moves)
+        except SearchTimeout:
+            break
+        best_move, best_score, completed_depth = next_move, score, depth
+
+        if abs(best_score) >= WIN_SCORE:
+            break
+        if time_manager is not None \
+                and not time_manager.can_start_iteration(time.time() - iteration_start):
+            break
+
+    return best_move, best_score, completed_depth
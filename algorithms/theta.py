@@ -0,0 +1,235 @@
+import sys
+import os
+import time
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algorithms.problem import State, Problem
+from algorithms.bitboard import BitState, BitProblem
+from algorithms.search import Searcher, TimeManager, SearchTimeout, iterative_deepening, WIN_SCORE
+from algorithms import tt
+
+
+'''
+    Lazy SMP version of zeta: helper processes search the same root as the
+    main process, at staggered depths and with rotated root moves, and they
+    all share one transposition table in shared memory. The helpers only
+    fill the table, the deepest completed iteration of any process is played.
+'''
+
+
+MAX_DEPTH = 30
+MAX_MOVE = 50 # moves per player in a game, same as constants.MAX_MOVE
+TIME_THINKING = 2.8 # never think longer than this (s), the UI warns at 3s
+NUM_WORKERS = os.cpu_count() or 1 # main process included
+USE_BITBOARD = True
+
+# used when no helper can be started, see get_pool
+TT = tt.TranspositionTable()
+
+_pool = None
+_pool_workers = 0
+_shared_table = None
+_stop = None # set by the main process when its time is over
+
+# per worker stats of the last search, see report
+LAST_STATS = []
+
+
+class _HelperClock:
+    '''Stands for the TimeManager of a helper: over at the deadline or when stopped.'''
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def is_over(self):
+        return _stop.value or time.time() >= self.deadline
+
+
+def _get_game(use_bitboard):
+    return (BitState, BitProblem()) if use_bitboard else (State, Problem())
+
+
+def _init_worker(shared_table, stop):
+    global _shared_table, _stop
+    _shared_table = shared_table
+    _stop = stop
+
+
+def _warm_up(_):
+    return os.getpid()
+
+
+def _helper_search(board, player, open_move, max_depth, deadline, generation, helper, use_bitboard):
+    '''
+        Iterative deepening of helper number `helper` (1, 2, ...), odd
+        helpers skip depth 1 so that helpers are not all on the same depth.
+
+        Output
+        ----------
+            stats: dict with move, score, depth, nodes, time.
+    '''
+    start = time.time()
+    _shared_table.generation = generation
+    State_, problem = _get_game(use_bitboard)
+    state = State_(board, player)
+    problem.set_open_move(state, open_move)
+    searcher = Searcher(problem, _shared_table, _HelperClock(deadline))
+
+    root_moves = searcher.order_moves(state, problem.get_possible_moves_after(state, open_move))
+    if not root_moves:
+        return {'worker': helper, 'move': None, 'score': -WIN_SCORE * player, 'depth': 0,
+                'nodes': 0, 'time': time.time() - start}
+    shift = helper % len(root_moves)
+    root_moves = root_moves[shift:] + root_moves[:shift]
+
+    best_move, best_score, completed_depth = root_moves[0], 0, 0
+    for depth in range(1 + helper % 2, max_depth+1):
+        try:
+            next_move, score = searcher.minimax(open_move, state, depth, -WIN_SCORE, WIN_SCORE, root_moves)
+        except SearchTimeout:
+            break
+        best_move, best_score, completed_depth = next_move, score, depth
+        if abs(best_score) >= WIN_SCORE:
+            break
+
+    return {'worker': helper, 'move': best_move, 'score': best_score, 'depth': completed_depth,
+            'nodes': searcher.nodes, 'time': time.time() - start}
+
+
+def _close():
+    global _pool, _shared_table
+    if _pool is not None:
+        _pool.shutdown()
+        _shared_table.close()
+        _pool, _shared_table = None, None
+
+atexit.register(_close)
+
+
+def get_pool(num_workers=None):
+    '''
+        Persistent, pre-warmed pool of num_workers-1 helpers sharing one
+        table with the main process. None when no helper can be used (single
+        worker, or we run inside a daemonic process, which may not have
+        children).
+    '''
+    global _pool, _pool_workers, _shared_table, _stop
+    num_workers = NUM_WORKERS if num_workers is None else num_workers
+    if num_workers <= 1 or multiprocessing.current_process().daemon:
+        return None
+    if _pool is None or _pool_workers != num_workers:
+        _close()
+        _shared_table = tt.SharedTranspositionTable(TT.size)
+        _stop = multiprocessing.Value('b', 0, lock=False)
+        _pool = ProcessPoolExecutor(num_workers - 1, initializer=_init_worker,
+                                    initargs=(_shared_table, _stop))
+        _pool_workers = num_workers
+        list(_pool.map(_warm_up, range(num_workers - 1)))
+    return _pool
+
+
+def search(board, player, open_move, time_manager, max_depth=None, num_workers=None):
+    '''
+        Lazy SMP search of `board` until `max_depth` or the time manager ends,
+        with `num_workers` processes (default MAX_DEPTH and NUM_WORKERS, read
+        at call time).
+
+        Output
+        ----------
+            (best_move, score, depth), per worker stats are kept in LAST_STATS.
+    '''
+    max_depth = MAX_DEPTH if max_depth is None else max_depth
+    State_, problem = _get_game(USE_BITBOARD)
+    state = State_(board, player)
+    problem.set_open_move(state, open_move)
+
+    # no helper when there is no move to share out
+    has_moves = bool(problem.get_possible_moves_after(state, open_move))
+    pool = get_pool(num_workers) if has_moves else None
+    table = TT if pool is None else _shared_table
+    table.new_search()
+
+    futures = []
+    if pool is not None:
+        _stop.value = 0
+        futures = [pool.submit(_helper_search, board, player, open_move, max_depth,
+                               time_manager.deadline, table.generation, helper, USE_BITBOARD)
+                   for helper in range(1, num_workers)]
+
+    start = time.time()
+    searcher = Searcher(problem, table, time_manager)
+    action, value, depth = iterative_deepening(searcher, state, open_move, max_depth, time_manager)
+    LAST_STATS[:] = [{'worker': 0, 'move': action, 'score': value, 'depth': depth,
+                      'nodes': searcher.nodes, 'time': time.time() - start}]
+
+    if pool is not None:
+        _stop.value = 1
+        LAST_STATS.extend(future.result() for future in futures)
+        # a helper may have completed a deeper iteration than we did
+        for stats in LAST_STATS[1:]:
+            if stats['depth'] > depth:
+                action, value, depth = stats['move'], stats['score'], stats['depth']
+
+    return action, value, depth
+
+
+def report(stats=LAST_STATS):
+    '''Print nodes/s of every worker and in total.'''
+    total_nodes = 0
+    for worker_stats in stats:
+        total_nodes += worker_stats['nodes']
+        print(f"worker {worker_stats['worker']:2d}: depth {worker_stats['depth']:2d}  "
+              f"{worker_stats['nodes'] / max(worker_stats['time'], 1e-9):9.0f} nodes/s")
+    elapsed = max(worker_stats['time'] for worker_stats in stats)
+    print(f'total    : {len(stats)} workers  {total_nodes / max(elapsed, 1e-9):9.0f} nodes/s')
+
+
+def move(prev_board, board, player, remain_time_x, remain_time_y, moves_left=None):
+    '''
+        Get best move found by all workers in the time budget of this move
+
+        Input
+        ----------
+            board: map(5*5);
+            player: 1 or -1, represent for player
+            remain_time_x: Time remain (ms)
+            remain_time_y: Time remain (ms)
+            moves_left: moves `player` still has to play, MAX_MOVE if unknown
+        Output
+        ----------
+            optimize action from all possible action.
+            eg. ((1,1),(1,2)).
+    '''
+    problem = Problem()
+    prev_state = State(prev_board, -player) if prev_board is not None else None
+    open_move = problem.get_open_move(prev_state, State(board, player))
+
+    remain_time = (remain_time_x if player == 1 else remain_time_y)/1000
+    time_manager = TimeManager(remain_time, moves_left or MAX_MOVE, TIME_THINKING)
+    action, _, _ = search(board, player, open_move, time_manager)
+    return action
+
+
+if __name__ == '__main__':
+    prev_board = [[-1, 0, -1, 1, 1],
+                    [-1, -1, 0, 0, 1],
+                    [-1, 0, 1, 0, 1],
+                    [1, 1, 0, 0, 1],
+                    [1, 1, 0, 0, 1]]
+    board = [[-1, 0,  0,  1,  -1],
+                [-1, -1,  0,  -1,  1],
+                [-1, 0,  -1,  0, 1],
+                [1, 1,  0,  0, 1],
+                [1, 1, 0, 0, 1]]
+    player = -1
+    open_move = Problem().get_open_move(State(prev_board, -player), State(board, player))
+    for num_workers in sorted({1, 2, 4, NUM_WORKERS}):
+        get_pool(num_workers) # spawn and warm up out of the timing
+        TT.clear()
+        if _shared_table is not None:
+            _shared_table.clear()
+        action, value, depth = search(board, player, open_move, TimeManager(2.0, 1, 2.0),
+                                      num_workers=num_workers)
+        print(f'{num_workers} workers: {action} value {value} depth {depth}')
+        report()
@@ -0,0 +1,244 @@
+'''
+    Bounded transposition table shared by the minimax bots.
+
+    The table is a preallocated array of 2*size slots: each bucket has one
+    depth-preferred slot and one always-replace slot. It lives at module level
+    in each bot, so its contents are kept across the moves of a game while the
+    memory stays the same however long the session is.
+
+    SharedTranspositionTable has the same interface over a shared memory
+    block, so the processes of a parallel search read and write one table.
+'''
+
+from multiprocessing import shared_memory
+
+
+# Bound type of a stored score
+EXACT = 0
+LOWER = 1 # score is a lower bound (the node failed high)
+UPPER = 2 # score is an upper bound (the node failed low)
+
+# Fields of an entry
+KEY, DEPTH, SCORE, FLAG, MOVE, GENERATION = range(6)
+
+
+def get_flag(score, alpha, beta):
+    '''Bound type of `score` returned by a search with window (alpha, beta).'''
+    if score <= alpha:
+        return UPPER
+    if score >= beta:
+        return LOWER
+    return EXACT
+
+
+def get_cutoff(entry, depth, alpha, beta):
+    '''
+        Score to return for a node searched to `depth` with window
+        (alpha, beta), None if the entry does not decide the node.
+    '''
+    if entry[DEPTH] < depth:
+        return None
+    score, flag = entry[SCORE], entry[FLAG]
+    if flag == EXACT \
+            or (flag == LOWER and score >= beta) \
+            or (flag == UPPER and score <= alpha):
+        return score
+    return None
+
+
+class TranspositionTable:
+    def __init__(self, size=1 << 16):
+        '''
+            size: number of buckets, rounded down to a power of two.
+        '''
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.slots = [None] * (2 * self.size)
+        self.generation = 0
+
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        '''Call once per move, entries of older searches are replaced first.'''
+        self.generation = (self.generation + 1) & 0xff
+
+    def clear(self):
+        self.slots = [None] * (2 * self.size)
+        self.generation = 0
+
+    def probe(self, key):
+        '''
+            Output
+            ----------
+                entry: tuple (key, depth, score, flag, move, generation)
+                       or None if the key is not stored.
+        '''
+        self.probes += 1
+        index = (key & self.mask) << 1
+        entry = self.slots[index]
+        if entry is None or entry[KEY] != key:
+            entry = self.slots[index + 1]
+            if entry is None or entry[KEY] != key:
+                return None
+        self.hits += 1
+        return entry
+
+    def store(self, key, depth, score, flag, move=None):
+        '''
+            Store a search result. The depth-preferred slot takes the entry if
+            it is empty, holds the same position, holds a shallower or older
+            search; its previous entry then falls back to the always-replace
+            slot. Otherwise the entry goes to the always-replace slot.
+        '''
+        index = (key & self.mask) << 1
+        entry = (key, depth, score, flag, move, self.generation)
+        current = self.slots[index]
+        if current is None or current[KEY] == key or current[DEPTH] <= depth \
+                or current[GENERATION] != self.generation:
+            if current is not None and current[KEY] != key:
+                self.slots[index + 1] = current
+            self.slots[index] = entry
+        else:
+            self.slots[index + 1] = entry
+
+
+# Packing of an entry of SharedTranspositionTable in one 64-bit word
+_SCORE_BITS, _DEPTH_BITS, _FLAG_BITS, _GENERATION_BITS = 16, 8, 2, 8
+_DEPTH_SHIFT = _SCORE_BITS
+_FLAG_SHIFT = _DEPTH_SHIFT + _DEPTH_BITS
+_GENERATION_SHIFT = _FLAG_SHIFT + _FLAG_BITS
+_MOVE_SHIFT = _GENERATION_SHIFT + _GENERATION_BITS
+_SCORE_OFFSET = 1 << (_SCORE_BITS - 1)
+_WORD = (1 << 64) - 1
+
+
+def _pack_move(move):
+    # 3 bits per coordinate (boards up to 8*8), 0 for no move
+    if move is None:
+        return 0
+    (start_y, start_x), (end_y, end_x) = move
+    return 1 << 12 | start_y << 9 | start_x << 6 | end_y << 3 | end_x
+
+
+def _unpack_move(bits):
+    if not bits:
+        return None
+    return ((bits >> 9 & 7, bits >> 6 & 7), (bits >> 3 & 7, bits & 7))
+
+
+class SharedTranspositionTable(TranspositionTable):
+    def __init__(self, size=1 << 16, name=None):
+        '''
+            Same slots and replacement as TranspositionTable, each slot is two
+            64-bit words (key ^ data, data) in a shared memory block. No lock
+            is taken: a reader rebuilds the key from both words, so a slot torn
+            by concurrent writers just reads as a miss.
+
+            Input
+            ----------
+                size: number of buckets, rounded down to a power of two.
+                name: shared memory block to attach to, a new block is
+                      created (and owned) if None.
+        '''
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=2 * self.size * 16)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.words = self.shm.buf.cast('Q')
+        self.generation = 0
+
+        self.probes = 0
+        self.hits = 0
+
+    def __reduce__(self):
+        # processes attach to the block, they do not copy it
+        return (SharedTranspositionTable, (self.size, self.name))
+
+    def clear(self):
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+        self.generation = 0
+
+    def _read(self, index):
+        words = self.words
+        check, data = words[2 * index], words[2 * index + 1]
+        if not data:
+            return None
+        return check ^ data, data
+
+    def _unpack(self, key, data):
+        return (key,
+                data >> _DEPTH_SHIFT & 0xff,
+                (data & 0xffff) - _SCORE_OFFSET,
+                data >> _FLAG_SHIFT & 3,
+                _unpack_move(data >> _MOVE_SHIFT),
+                data >> _GENERATION_SHIFT & 0xff)
+
+    def probe(self, key):
+        '''Same as TranspositionTable.probe.'''
+        self.probes += 1
+        index = (key & self.mask) << 1
+        for slot in (index, index + 1):
+            stored = self._read(slot)
+            if stored is not None and stored[0] == key:
+                self.hits += 1
+                return self._unpack(*stored)
+        return None
+
+    def _write(self, index, key, data):
+        self.words[2 * index + 1] = data
+        self.words[2 * index] = key ^ data
+
+    def store(self, key, depth, score, flag, move=None):
+        '''Same as TranspositionTable.store.'''
+        # numpy integers (State.material) would make the packed words numpy
+        # int64, which overflow on keys of 2**63 or more
+        key, score, depth = int(key), int(score), int(depth)
+        index = (key & self.mask) << 1
+        data = (score + _SCORE_OFFSET) \
+            | min(depth, 0xff) << _DEPTH_SHIFT \
+            | flag << _FLAG_SHIFT \
+            | self.generation << _GENERATION_SHIFT \
+            | _pack_move(move) << _MOVE_SHIFT
+        current = self._read(index)
+        if current is None or current[0] == key \
+                or (current[1] >> _DEPTH_SHIFT & 0xff) <= depth \
+                or (current[1] >> _GENERATION_SHIFT & 0xff) != self.generation:
+            if current is not None and current[0] != key:
+                self._write(index + 1, *current)
+            self._write(index, key, data)
+        else:
+            self._write(index + 1, key, data)
+
+    def close(self):
+        '''Detach from the block, the owner also frees it.'''
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def check_shared_table():
+    '''
+        Store and probe SharedTranspositionTable entries with numpy scores
+        and keys of 2**63 or more, as the game cores give them.
+    '''
+    import numpy as np
+
+    table = SharedTranspositionTable(1 << 4)
+    try:
+        for key, score in (((1 << 64) - 1, np.int64(-7)), (1 << 63, np.int64(12)), (5, np.int32(3))):
+            table.store(key, 4, score, EXACT, ((0, 1), (1, 1)))
+            entry = table.probe(key)
+            assert entry == (key, 4, int(score), EXACT, ((0, 1), (1, 1)), 0), entry
+    finally:
+        table.close()
+    print('shared table stores numpy scores and 64-bit keys')
+
+
+if __name__ == '__main__':
+    check_shared_table()
@@ -0,0 +1,140 @@
+import sys
+import os
+import time
+import atexit
+import inspect
+import traceback
+import weakref
+import multiprocessing.util # registers the exit handler joining the children first, see close_all
+from multiprocessing import Pipe, Process
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+'''
+    Long-lived process running one bot: positions are sent over a pipe and
+    moves come back, so imports, models, transposition tables and MCTS trees
+    stay warm between the moves of a game. The thinking time is measured in
+    the worker, around the call of the bot only.
+'''
+
+
+_workers = weakref.WeakSet()
+
+
+def takes_moves_left(algorithm):
+    '''True if the bot accepts the moves_left keyword (zeta, theta).'''
+    try:
+        return 'moves_left' in inspect.signature(algorithm).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _serve(algorithm, connection):
+    if isinstance(algorithm, str):
+        from algorithms import get_algorithm
+        algorithm = get_algorithm(algorithm)
+    with_moves_left = takes_moves_left(algorithm)
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError: # the game is gone
+            break
+        if request is None:
+            break
+        prev_board, board, player, remain_time_x, remain_time_y, moves_left = request
+        kwargs = {'moves_left': moves_left} if with_moves_left and moves_left is not None else {}
+        start_time = time.time()
+        try:
+            move = algorithm(prev_board, board, player, remain_time_x, remain_time_y, **kwargs)
+            error = None
+        except Exception:
+            move, error = None, traceback.format_exc()
+        end_time = time.time()
+        connection.send((move, (end_time-start_time)*1000, error))
+    connection.close()
+
+
+class AIWorker:
+    def __init__(self, algorithm):
+        '''
+            Start the process of `algorithm`, a registry name (imported in the
+            worker) or a move function.
+
+            The process is not daemonic so that bots can start their own
+            worker pools (eta, theta, mcts_base); close() stops it, and it is
+            closed at exit otherwise.
+        '''
+        self.connection, worker_connection = Pipe()
+        self.process = Process(target=_serve, args=(algorithm, worker_connection))
+        self.process.start()
+        worker_connection.close()
+        self.waiting = False
+        _workers.add(self)
+
+    def request(self, prev_board, board, player, remain_time_x, remain_time_y, moves_left=None):
+        '''Send a position, the move is read with poll/receive.'''
+        self.connection.send((prev_board, board, player, remain_time_x, remain_time_y, moves_left))
+        self.waiting = True
+
+    def poll(self):
+        '''True once the move of the last request is ready.'''
+        return self.waiting and self.connection.poll()
+
+    def receive(self):
+        '''
+            Output
+            ----------
+                (move, thinking_time): thinking time in ms, measured in the
+                worker.
+        '''
+        move, thinking_time, error = self.connection.recv()
+        self.waiting = False
+        if error is not None:
+            raise RuntimeError(f'AI worker failed:\n{error}')
+        return move, thinking_time
+
+    def move(self, prev_board, board, player, remain_time_x, remain_time_y, moves_left=None):
+        '''request + receive, blocking.'''
+        self.request(prev_board, board, player, remain_time_x, remain_time_y, moves_left)
+        return self.receive()
+
+    def close(self, timeout=1.0):
+        if self.process is None:
+            return
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive(): # still thinking
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+        self.process = None
+
+
+def close_all():
+    for worker in list(_workers):
+        worker.close()
+
+# runs before multiprocessing joins its non daemonic children at exit (atexit
+# handlers run in reverse order), which would wait for the workers forever
+atexit.register(close_all)
+
+
+if __name__ == '__main__':
+    from algorithms.problem import Problem
+
+    # the first move pays for the imports (and model), the next ones do not
+    board = Problem().init_state.board
+    for name in ('alpha', 'zeta', 'mcts_reuse', 'deep_ai'):
+        worker = AIWorker(name)
+        start = time.time()
+        times = []
+        for _ in range(3):
+            move, thinking_time = worker.move(None, board, 1, 100000, 100000, moves_left=50)
+            times.append(thinking_time)
+        print(f'{name:10s} {move}  thinking (ms): ' + ' '.join(f'{t:7.1f}' for t in times)
+              + f'  round trips {time.time() - start:5.2f}s')
+        worker.close()
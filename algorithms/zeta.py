@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algorithms.problem import State, Problem
+from algorithms.bitboard import BitState, BitProblem
+from algorithms.search import Searcher, TimeManager, iterative_deepening
+from algorithms import tt
+
+
+'''
+    Improve epsilon with iterative deepening under a time manager
+'''
+
+
+MAX_DEPTH = 30
+MAX_MOVE = 50 # moves per player in a game, same as constants.MAX_MOVE
+TIME_THINKING = 2.8 # never think longer than this (s), the UI warns at 3s
+USE_BITBOARD = True
+MAX_NODES = None # node budget of a move, None for the clock only
+
+# kept across moves, see algorithms/tt.py
+TT = tt.TranspositionTable()
+
+# nodes, cutoffs, table probes and depth of the last search, see bench.py
+LAST_STATS = {}
+
+def move(prev_board, board, player, remain_time_x, remain_time_y, moves_left=None):
+    '''
+        Get best move found in the time budget of this move
+
+        Input
+        ----------
+            board: map(5*5);
+            player: 1 or -1, represent for player
+            remain_time_x: Time remain (ms)
+            remain_time_y: Time remain (ms)
+            moves_left: moves `player` still has to play, MAX_MOVE if unknown
+        Output  
+        ----------
+            optimize action from all possible action.
+            eg. ((1,1),(1,2)).  
+    '''
+
+    State_, Problem_ = (BitState, BitProblem) if USE_BITBOARD else (State, Problem)
+    state = State_(board, player)
+    prev_state = State_(prev_board, -player) if prev_board is not None else None
+    problem = Problem_()
+    TT.new_search()
+
+    remain_time = (remain_time_x if player == 1 else remain_time_y)/1000
+    time_manager = TimeManager(remain_time, moves_left or MAX_MOVE, TIME_THINKING)
+    searcher = Searcher(problem, TT, time_manager, MAX_NODES)
+    probes, hits = TT.probes, TT.hits
+
+    open_move = problem.get_open_move(prev_state, state)
+    problem.set_open_move(state, open_move)
+    action, value, depth = iterative_deepening(searcher, state, open_move, MAX_DEPTH, time_manager)
+    LAST_STATS.update(nodes=searcher.nodes, cutoffs=searcher.cutoffs, tt_probes=TT.probes - probes,
+                      tt_hits=TT.hits - hits, depth=depth, time=time_manager.elapsed())
+    return action
+
+
+if __name__ == '__main__':
+    prev_board = [[-1, 0, -1, 1, 1],
+                    [-1, -1, 0, 0, 1],
+                    [-1, 0, 1, 0, 1],
+                    [1, 1, 0, 0, 1],
+                    [1, 1, 0, 0, 1]]
+    board = [[-1, 0,  0,  1,  -1],
+                [-1, -1,  0,  -1,  1],
+                [-1, 0,  -1,  0, 1],
+                [1, 1,  0,  0, 1],
+                [1, 1, 0, 0, 1]]      
+    player = -1
+    start = time.time()
+    a = move(prev_board, board, player, 100000, 100000)
+    print(a, time.time()-start)
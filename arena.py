@@ -0,0 +1,324 @@
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import importlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1'
+
+from constants import MAX_MOVE, MAX_TOTAL_TIME
+from algorithms import REGISTRY, get_algorithm
+from algorithms.problem import Problem
+from algorithms.worker import takes_moves_left
+import rating
+
+
+'''
+    Headless tournament between registered bots, the games are played in
+    parallel by a process pool with the rules of the game UI: MAX_MOVE moves
+    per player (then the material decides) and MAX_TOTAL_TIME seconds of
+    thinking per player. One JSON line is written per finished game, an
+    interrupted run is resumed by running the same command again (a game id
+    holds the seed and the rules, other settings play new games).
+
+    The bots with a process pool of their own (NUM_WORKERS of eta, theta,
+    mcts_base) share the cores with the games: each game gets
+    cpu_count // workers of them, so the bots do not lose on the clock.
+
+        python arena.py --bots alpha epsilon eta --games 20 --workers 4
+        python arena.py --gauntlet deep_ai --bots alpha epsilon --games 100
+        python arena.py --bots epsilon alpha --games 2000 --sprt 0 10
+'''
+
+
+OPENING_PLIES = 2 # random moves before the bots play, the same for both colors of a pair
+DEFAULT_OUTPUT = 'arena.jsonl'
+
+_problem = None # per pool worker
+_bot_workers = None # NUM_WORKERS of the bots, per pool worker
+
+
+def schedule(bots, games, gauntlet=None, seed=45, max_move=MAX_MOVE, max_total_time=MAX_TOTAL_TIME,
+             opening_plies=OPENING_PLIES):
+    '''
+        Games of a round robin between `bots`, or of `gauntlet` against each
+        of them. Each pairing plays `games` games, colors alternate and the
+        two games with the same colors swapped share an opening seed.
+
+        Output
+        ----------
+            list of {'game', 'player1', 'player2', 'seed', 'max_move',
+            'max_total_time', 'opening_plies'}, player1 (blue) moves first.
+            The game id holds the seed and the rules, so that a results file
+            is only resumed with the same settings.
+    '''
+    rules = dict(max_move=max_move, max_total_time=max_total_time, opening_plies=opening_plies)
+    settings = f's{seed}-m{max_move}-t{max_total_time:g}-o{opening_plies}'
+    if gauntlet is not None:
+        pairings = [(gauntlet, bot) for bot in bots if bot != gauntlet]
+    else:
+        pairings = list(itertools.combinations(bots, 2))
+
+    specs = []
+    for bot_a, bot_b in pairings:
+        for index in range(games):
+            player1, player2 = (bot_a, bot_b) if index % 2 == 0 else (bot_b, bot_a)
+            specs.append({
+                'game': f'{bot_a}-{bot_b}-{index}-{settings}',
+                'player1': player1,
+                'player2': player2,
+                'seed': f'{seed}:{bot_a}:{bot_b}:{index // 2}',
+                **rules,
+            })
+    return specs
+
+
+def _init_worker(bot_workers):
+    global _bot_workers
+    _bot_workers = bot_workers
+
+
+def _load_bot(name):
+    bot = get_algorithm(name)
+    module = importlib.import_module(f'algorithms.{REGISTRY[name].module}')
+    if _bot_workers is not None and hasattr(module, 'NUM_WORKERS'):
+        module.NUM_WORKERS = _bot_workers
+    if hasattr(bot, 'reset'): # one side of one game, see MCTSBot
+        bot = copy.copy(bot)
+        bot.reset()
+    return bot
+
+
+def _random_opening(problem, state, rng, plies):
+    prev_state, opening = None, []
+    for _ in range(plies):
+        dict_possible_moves = problem.get_possible_moves(prev_state, state)
+        if not dict_possible_moves or state.check_winning_state() != 0:
+            break
+        start = rng.choice(sorted(dict_possible_moves))
+        action = (start, rng.choice(sorted(dict_possible_moves[start])))
+        prev_state, state = state, problem.move(state, action)
+        opening.append(action)
+    return prev_state, state, opening
+
+
+def play_game(spec):
+    '''
+        Play the game `spec` (see schedule), with its rules.
+
+        Output
+        ----------
+            the spec with 'winner' (1: player1, -1: player2, 0: draw), 'reason'
+            ('win', 'move_limit', 'time', 'no_move': no legal move, 'illegal'
+            or 'error'), 'moves', 'opening' and the thinking time of each
+            player (ms).
+    '''
+    global _problem
+    if _problem is None:
+        _problem = Problem()
+    problem = _problem
+    max_move, max_total_time = spec['max_move'], spec['max_total_time']
+
+    rng = random.Random(spec['seed'])
+    random.seed(spec['seed']) # bots drawing from the random module
+    prev_state, state, opening = _random_opening(problem, problem.init_state.copy(), rng, spec['opening_plies'])
+
+    bots = {1: _load_bot(spec['player1']), -1: _load_bot(spec['player2'])}
+    with_moves_left = {player: takes_moves_left(bot) for player, bot in bots.items()}
+    remain_move = {1: max_move, -1: max_move}
+    remain_time = {1: max_total_time * 1000, -1: max_total_time * 1000} # (ms)
+    winner, reason, error = None, None, None
+
+    while winner is None:
+        if state.check_winning_state() != 0:
+            winner, reason = state.check_winning_state(), 'win'
+            break
+        if remain_move[1] == 0 and remain_move[-1] == 0:
+            diff = int((state.board == 1).sum() - (state.board == -1).sum())
+            winner, reason = (diff > 0) - (diff < 0), 'move_limit'
+            break
+
+        player = state.player
+        kwargs = {'moves_left': remain_move[player]} if with_moves_left[player] else {}
+        prev_board = None if prev_state is None else prev_state.board.copy()
+        start_time = time.time()
+        try:
+            action = bots[player](prev_board, state.board.copy(), player,
+                                  remain_time[1], remain_time[-1], **kwargs)
+        except Exception as exception:
+            action, error = None, repr(exception)
+        remain_time[player] -= (time.time() - start_time) * 1000
+
+        if action is None:
+            # a blocked player loses, as a bot giving up with moves left
+            if error is None and problem.get_possible_moves(prev_state, state):
+                error = 'no move returned'
+            winner, reason = -player, 'error' if error is not None else 'no_move'
+            break
+        if remain_time[player] <= 0: # as _process_end_by_time, checked first
+            winner, reason = -player, 'time'
+            break
+        action = tuple(tuple(int(v) for v in pos) for pos in action)
+        can_do, next_state = problem.move_if_possible(prev_state, state, action)
+        if not can_do: # the game UI would ask again, a bot would answer the same
+            winner, reason, error = -player, 'illegal', f'illegal move {action}'
+            break
+        prev_state, state = state, next_state
+        remain_move[player] -= 1
+
+    result = dict(spec, winner=winner, reason=reason,
+                  moves=2 * max_move - remain_move[1] - remain_move[-1], opening=opening,
+                  time_p1=round(max_total_time * 1000 - remain_time[1], 1),
+                  time_p2=round(max_total_time * 1000 - remain_time[-1], 1))
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def load_results(path):
+    '''Finished games of `path`, by game id; a truncated last line is ignored.'''
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError: # killed while writing
+                continue
+            results[result['game']] = result
+    return results
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
+
+
+def run(specs, output=DEFAULT_OUTPUT, num_workers=None, bot_workers=None):
+    '''
+        Play the games of `specs` not already in `output`, appending one
+        JSON line per game as they finish. bot_workers: NUM_WORKERS of the
+        bots with a process pool, cpu_count // num_workers if None.
+
+        Output
+        ----------
+            every result of `output` for `specs`, by game id.
+    '''
+    results = load_results(output)
+    pending = [spec for spec in specs if spec['game'] not in results]
+    print(f'{len(specs) - len(pending)} of {len(specs)} games already played, {len(pending)} to play')
+    if not pending:
+        return {spec['game']: results[spec['game']] for spec in specs}
+
+    num_workers = num_workers or os.cpu_count()
+    bot_workers = bot_workers or max(1, os.cpu_count() // num_workers)
+    start_time = time.time()
+    with open(output, 'a') as file, \
+            ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(bot_workers,)) as pool:
+        if file.tell() and not _ends_with_newline(output):
+            file.write('\n') # after the truncated line
+        futures = [pool.submit(play_game, spec) for spec in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            file.write(json.dumps(result) + '\n')
+            file.flush() # a killed run keeps its finished games
+            results[result['game']] = result
+            if done % 10 == 0 or done == len(pending):
+                elapsed = time.time() - start_time
+                print(f'{done}/{len(pending)} games, {done / elapsed * 3600:.0f} games/h')
+    return {spec['game']: results[spec['game']] for spec in specs}
+
+
+def run_sprt(bot, opponent, max_games, elo0, elo1, output=DEFAULT_OUTPUT, num_workers=None,
+             bot_workers=None, seed=45, alpha=0.05, beta=0.05, **rules):
+    '''
+        Head-to-head match of at most max_games games, played in batches
+        (one game per worker and color) until the SPRT of rating.sprt is
+        decided. rules: max_move, max_total_time, opening_plies of schedule.
+
+        Output
+        ----------
+            (results by game id, test)
+    '''
+    specs = schedule([bot, opponent], max_games, seed=seed, **rules)
+    num_workers = num_workers or os.cpu_count()
+    batch = 2 * num_workers
+    results, test = {}, None
+    for begin in range(0, len(specs), batch):
+        results.update(run(specs[begin:begin + batch], output, num_workers, bot_workers))
+        test = rating.print_sprt(results.values(), bot, opponent, elo0, elo1, alpha, beta)
+        if test['decision'] is not None:
+            break
+    return results, test
+
+
+def standings(results):
+    '''Points (win 1, draw 0.5) and win/draw/loss of each bot.'''
+    table = {}
+    for result in results:
+        for player, name in ((1, result['player1']), (-1, result['player2'])):
+            row = table.setdefault(name, {'games': 0, 'win': 0, 'draw': 0, 'loss': 0, 'points': 0.0})
+            row['games'] += 1
+            if result['winner'] == 0:
+                row['draw'] += 1
+                row['points'] += 0.5
+            elif result['winner'] == player:
+                row['win'] += 1
+                row['points'] += 1
+            else:
+                row['loss'] += 1
+    return table
+
+
+def print_standings(results):
+    table = standings(results)
+    print(f'\n{"bot":12s} {"games":>6s} {"win":>5s} {"draw":>5s} {"loss":>5s} {"score":>7s}')
+    for name, row in sorted(table.items(), key=lambda item: -item[1]['points'] / item[1]['games']):
+        print(f'{name:12s} {row["games"]:6d} {row["win"]:5d} {row["draw"]:5d} {row["loss"]:5d} '
+              f'{row["points"] / row["games"]:7.1%}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless tournament between registered bots.')
+    parser.add_argument('--bots', nargs='+', default=[name for name, info in REGISTRY.items() if info.in_menu],
+                        choices=list(REGISTRY), help='round robin between these bots')
+    parser.add_argument('--gauntlet', choices=list(REGISTRY),
+                        help='play this bot against each of --bots instead of a round robin')
+    parser.add_argument('--games', type=int, default=2, help='games per pairing, colors alternate')
+    parser.add_argument('--workers', type=int, default=None, help='parallel games (default: cpu count)')
+    parser.add_argument('--bot-workers', type=int, default=None,
+                        help='processes of the parallel bots per game (default: cpu count // workers)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON lines file, resumed if it exists')
+    parser.add_argument('--seed', type=int, default=45)
+    parser.add_argument('--max-move', type=int, default=MAX_MOVE)
+    parser.add_argument('--max-total-time', type=float, default=MAX_TOTAL_TIME, help='seconds per player')
+    parser.add_argument('--opening-plies', type=int, default=OPENING_PLIES)
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'),
+                        help='head-to-head match of two bots, stopped once the SPRT is decided '
+                             '(--games is then the maximum)')
+    args = parser.parse_args(argv)
+
+    rules = dict(max_move=args.max_move, max_total_time=args.max_total_time,
+                 opening_plies=args.opening_plies)
+    if args.sprt is not None:
+        bots = list(dict.fromkeys([args.gauntlet] + args.bots if args.gauntlet is not None else args.bots))
+        if len(bots) != 2:
+            parser.error('--sprt plays one pairing, give two bots (or --gauntlet and one bot)')
+        results, _ = run_sprt(*bots, args.games, *args.sprt, args.output, args.workers, args.bot_workers,
+                              args.seed, **rules)
+    else:
+        specs = schedule(args.bots, args.games, args.gauntlet, args.seed, **rules)
+        results = run(specs, args.output, args.workers, args.bot_workers)
+    print_standings(results.values())
+    rating.print_ratings(results.values())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
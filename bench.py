@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1'
+
+import numpy as np
+
+try:
+    import resource
+except ImportError: # not on Windows, peak RSS is not reported there
+    resource = None
+
+from algorithms import REGISTRY
+
+
+'''
+    Search benchmark: each bot searches the positions of bench_positions.json
+    under a fixed budget (depth, nodes or seconds) with a fixed seed and an
+    empty transposition table. Nodes, nodes/s, TT hit rate, cutoff rate,
+    chosen moves and peak RSS are written to a JSON report, which can be
+    compared with a baseline: a throughput drop above the threshold fails
+    the run. Throughput depends on the machine, so no baseline is shipped:
+    write one first on the machine that compares, then compare with it.
+
+        python bench.py --save-baseline
+        python bench.py --baseline bench_baseline.json
+'''
+
+
+POSITIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_positions.json')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+REPORT_PATH = 'bench_report.json'
+THRESHOLD = 0.15 # largest accepted drop of nodes/s
+SEED = 45
+REMAIN_TIME = 10**9 # (ms) given to the bots, the budget is the only limit
+
+# (bot, budget kind, value): depth in plies, nodes (playouts for MCTS) or seconds
+BUDGETS = [
+    ('beta', 'depth', 3),
+    ('delta', 'depth', 4),
+    ('epsilon', 'depth', 5),
+    ('zeta', 'depth', 6),
+    ('zeta', 'nodes', 20000),
+    ('zeta', 'time', 0.5),
+    ('mcts_base', 'nodes', 2000),
+    ('mcts_base', 'time', 0.5),
+]
+
+# module constant setting a budget kind, by bot (None: any bot)
+KNOBS = {
+    'depth': {None: 'MAX_DEPTH'},
+    'nodes': {'zeta': 'MAX_NODES', 'mcts_base': 'MAX_PLAYOUTS'},
+    'time': {None: 'TIME_THINKING'},
+}
+
+
+def load_positions(path=POSITIONS_PATH):
+    '''List of {'name', 'prev_board', 'board', 'player'}.'''
+    with open(path) as file:
+        return json.load(file)
+
+
+def budget_key(bot, kind, value):
+    return f'{bot}:{kind}={value}'
+
+
+def _set_budget(module, bot, kind, value):
+    knobs = KNOBS[kind]
+    attribute = knobs.get(bot, knobs.get(None))
+    if attribute is None or not hasattr(module, attribute):
+        raise ValueError(f'{bot} has no {kind} budget')
+    setattr(module, attribute, value)
+    # the other limits must not stop the search first
+    if kind != 'time' and hasattr(module, 'TIME_THINKING'):
+        module.TIME_THINKING = REMAIN_TIME / 1000
+    if kind == 'nodes' and hasattr(module, 'MAX_DEPTH') and bot == 'zeta':
+        module.MAX_DEPTH = 30
+
+
+def run_budget(bot, kind, value, positions, seed=SEED):
+    '''
+        Search every position with `bot` under one budget, in this process
+        (bench runs each budget in a fresh process, for the peak RSS).
+
+        Output
+        ----------
+            {'positions': {name: record}, 'total': record}, a record has
+            move, nodes, time, nodes_per_sec, tt_hit_rate, cutoff_rate.
+    '''
+    module = importlib.import_module(f'algorithms.{REGISTRY[bot].module}')
+    _set_budget(module, bot, kind, value)
+
+    records = {}
+    totals = dict(nodes=0, time=0.0, tt_probes=0, tt_hits=0, cutoffs=0)
+    for position in positions:
+        if hasattr(module, 'TT'):
+            module.TT.clear()
+        random.seed(seed)
+        np.random.seed(seed)
+
+        start_time = time.perf_counter()
+        action = module.move(position['prev_board'], position['board'], position['player'],
+                             REMAIN_TIME, REMAIN_TIME)
+        elapsed = time.perf_counter() - start_time
+
+        stats = module.LAST_STATS
+        nodes = stats.get('playouts', stats.get('nodes', 0)) # MCTS counts playouts
+        record = dict(move=[list(map(int, pos)) for pos in action], nodes=nodes, time=elapsed,
+                      nodes_per_sec=nodes / max(elapsed, 1e-9))
+        if 'tt_probes' in stats:
+            record['tt_hit_rate'] = stats['tt_hits'] / max(stats['tt_probes'], 1)
+            record['cutoff_rate'] = stats['cutoffs'] / max(stats['nodes'], 1)
+            for name in ('tt_probes', 'tt_hits', 'cutoffs'):
+                totals[name] += stats[name]
+        if 'depth' in stats:
+            record['depth'] = stats['depth']
+        records[position['name']] = record
+        totals['nodes'] += nodes
+        totals['time'] += elapsed
+
+    total = dict(nodes=totals['nodes'], time=totals['time'],
+                 nodes_per_sec=totals['nodes'] / max(totals['time'], 1e-9))
+    if totals['tt_probes']:
+        total['tt_hit_rate'] = totals['tt_hits'] / totals['tt_probes']
+        total['cutoff_rate'] = totals['cutoffs'] / max(totals['nodes'], 1)
+    if resource is not None:
+        total['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux
+    return {'positions': records, 'total': total}
+
+
+def run(budgets=BUDGETS, positions=None, seed=SEED):
+    '''Report of every budget, each one run in a new process.'''
+    positions = positions or load_positions()
+    context = multiprocessing.get_context('spawn') # a clean process, its peak RSS is the bot's
+    results = {}
+    for bot, kind, value in budgets:
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(run_budget, bot, kind, value, positions, seed).result()
+        results[budget_key(bot, kind, value)] = result
+        total = result['total']
+        print(f'{budget_key(bot, kind, value):24s} {total["nodes"]:9d} nodes {total["time"]:7.2f}s '
+              f'{total["nodes_per_sec"]:9.0f} nodes/s'
+              + (f'  tt hits {total["tt_hit_rate"]:5.1%} cutoffs {total["cutoff_rate"]:5.1%}'
+                 if 'tt_hit_rate' in total else '')
+              + (f'  peak rss {total["peak_rss_kb"] / 1024:6.1f}MB' if 'peak_rss_kb' in total else ''))
+    return {'seed': seed, 'python': platform.python_version(), 'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+
+
+def compare(report, baseline, threshold=THRESHOLD):
+    '''
+        Print the differences between report and baseline.
+
+        Output
+        ----------
+            list of the budgets whose nodes/s dropped by more than threshold.
+    '''
+    regressions = []
+    print(f'\n{"budget":24s} {"baseline":>10s} {"current":>10s} {"change":>8s}')
+    for key, result in report['results'].items():
+        if key not in baseline['results']:
+            print(f'{key:24s} {"-":>10s} {result["total"]["nodes_per_sec"]:10.0f}      new')
+            continue
+        old, new = baseline['results'][key], result
+        old_nps, new_nps = old['total']['nodes_per_sec'], new['total']['nodes_per_sec']
+        change = new_nps / old_nps - 1 if old_nps else 0.0
+        status = 'REGRESSION' if change < -threshold else ''
+        if status:
+            regressions.append(key)
+        print(f'{key:24s} {old_nps:10.0f} {new_nps:10.0f} {change:+8.1%} {status}')
+
+        # with the same seed and budget, the search itself should not change
+        for name, record in new['positions'].items():
+            old_record = old['positions'].get(name)
+            if old_record is None:
+                continue
+            if record['move'] != old_record['move']:
+                print(f'    {name}: move {old_record["move"]} -> {record["move"]}')
+            if record['nodes'] != old_record['nodes'] and key.split(':')[1].startswith('depth'):
+                print(f'    {name}: nodes {old_record["nodes"]} -> {record["nodes"]}')
+
+    if regressions:
+        print(f'\nnodes/s dropped by more than {threshold:.0%}: {", ".join(regressions)}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search benchmark of the bots.')
+    parser.add_argument('--bots', nargs='+', choices=sorted({bot for bot, _, _ in BUDGETS}),
+                        help='only the budgets of these bots')
+    parser.add_argument('--positions', default=POSITIONS_PATH)
+    parser.add_argument('--output', default=REPORT_PATH, help='JSON report')
+    parser.add_argument('--baseline', help='report to compare with, the run fails on a regression')
+    parser.add_argument('--save-baseline', action='store_true', help=f'also write the report to {BASELINE_PATH}')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args(argv)
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(f'no baseline {args.baseline}, write one first with: python bench.py --save-baseline')
+
+    budgets = [budget for budget in BUDGETS if args.bots is None or budget[0] in args.bots]
+    report = run(budgets, load_positions(args.positions), args.seed)
+    paths = [args.output] + ([BASELINE_PATH] if args.save_baseline else [])
+    for path in paths:
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -2,9 +2,8 @@ import os
 import time
 import random
 
-from tensorflow.keras.models import load_model
-
-from algorithms import Problem,alpha,deep_ai
+from algorithms import Problem, get_algorithm
+from ml_algorithms import runtime
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' 
 random.seed(45)
@@ -12,8 +11,9 @@ random.seed(45)
 
 def fight(num_match, max_move=50):
     result = {1:0, 0:0, -1:0}
+    alpha, deep_ai = get_algorithm('alpha'), get_algorithm('deep_ai')
     problem = Problem()
-    model = load_model('./ml_algorithms/model/model.h5')
+    model = runtime.load_model()
 
     for i in range(num_match):
         pre_state = None
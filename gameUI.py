@@ -2,7 +2,6 @@ import copy
 import sys
 import random
 import time
-from multiprocessing import Queue, Process
 from os import environ, system
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 system("")
@@ -10,7 +9,8 @@ system("")
 import pygame
 import numpy as np
 
-from algorithms import State,Problem,_move_AI_bounder
+from algorithms import State,Problem
+from algorithms.worker import AIWorker
 from constants import *
 
 
@@ -203,6 +203,9 @@ class BaseGameUI:
     def should_quit(self):
         return self.ESC
 
+    def close(self):
+        pass
+
 
 
 
@@ -268,20 +271,26 @@ class HumanGameUIMixin():
 
 
 class ComputerGameUIMixin:
+    def _get_AI_worker(self,algorithm):
+        # one worker per side, kept for the whole game so the bot stays warm
+        if self.state.player not in self.AI_workers:
+            self.AI_workers[self.state.player] = AIWorker(algorithm)
+        return self.AI_workers[self.state.player]
+
     def _handle_move_by_AI(self,algorithm):
-        # simulate alpha
-        
+        worker = self._get_AI_worker(algorithm)
         if not self.thinking_AI:
             self.thinking_AI = True
-            self.return_queue = Queue()
+            self.AI_request_state = self.state
             prev_board = None if len(self.move_log) == 0 else self.move_log[-1].board
-            self.move_AI_process = Process(target=_move_AI_bounder,
-                args=(prev_board,self.state.board,self.state.player,self.remain_time_p1,\
-                        self.remain_time_p2,algorithm,self.return_queue))
-            self.move_AI_process.daemon = True
-            self.move_AI_process.start()
-        if self.move_AI_process is not None and not self.move_AI_process.is_alive():
-            ai_move, time_thinking = self.return_queue.get()
+            moves_left = self.remain_move_p1 if self.state.player == 1 else self.remain_move_p2
+            worker.request(prev_board,self.state.board,self.state.player,self.remain_time_p1,\
+                        self.remain_time_p2,moves_left)
+        if worker.poll():
+            ai_move, time_thinking = worker.receive()
+            self.thinking_AI = False
+            if self.state is not self.AI_request_state: # undone while thinking
+                return
 
             if time_thinking > 3000:
                 print(f"\33[91m[WARNING] Thinking time p{(-self.state.player+1)//2+1} (= {time_thinking/1000:0.1f}s) must less than 3s\33[0m")
@@ -293,7 +302,12 @@ class ComputerGameUIMixin:
                 self.time_thinking_p2 = time_thinking
                 self.remain_time_p2 -= self.time_thinking_p2
             self._make_move(ai_move)
-            self.thinking_AI = False
+
+    def close(self):
+        for worker in self.AI_workers.values():
+            worker.close()
+        self.AI_workers.clear()
+        self.thinking_AI = False
 
     def _process_end_by_time(self):
         if not self.over:
@@ -359,8 +373,8 @@ class HVCGameUI(ComputerGameUIMixin,HumanGameUIMixin,BaseGameUI):
         # need when using ComputerGameUIMixin
         self.thinking_AI = False
         self.time_thinking_p2 = 0
-        self.move_AI_process = None
-        self.return_queue = None
+        self.AI_workers = {}
+        self.AI_request_state = None
 
     def _process_input(self, events):
         super(HVCGameUI,self)._process_input(events)
@@ -443,8 +457,8 @@ class CVCGameUI(ComputerGameUIMixin,BaseGameUI):
         self.thinking_AI = False
         self.time_thinking_p1 = 0
         self.time_thinking_p2 = 0
-        self.move_AI_process = None
-        self.return_queue = None
+        self.AI_workers = {}
+        self.AI_request_state = None
 
     def _process_input(self, events):
         super(CVCGameUI,self)._process_input(events)
@@ -9,24 +9,18 @@ import pygame
 import pygame_menu
 
 from constants import *
-from algorithms import alpha,beta,delta,epsilon,mcts_base,deep_ai
+from algorithms import REGISTRY
 from gameUI import HVHGameUI,HVCGameUI,CVCGameUI
 
 # Global Constant
-ALGORITHM_CHOICES = [
-    ('Alpha',alpha),
-    # ('Beta',beta),
-
-    # ('Delta',delta),
-    ('Epsilon',epsilon),
-    ('MCTS_BASE',mcts_base),
-    ('DEEP_AI',deep_ai),
-]
+# (menu name, registry name), the AI worker imports the bot from its name
+ALGORITHM_CHOICES = [(info.name, name) for name, info in REGISTRY.items() if info.in_menu]
 
 # Global Variable
 CURRENT_STATE = 'MENU' # HvH, HvC, CvC, MENU
 ALGORITHM_P1 = ALGORITHM_CHOICES[0][1]
 ALGORITHM_P2 = ALGORITHM_CHOICES[0][1]
+GAME = None
 
 if __name__ == '__main__':
 
@@ -154,11 +148,14 @@ if __name__ == '__main__':
                 GAME.process(events,deltatime)
                 
             if GAME.should_quit():
+                GAME.close()
                 CURRENT_STATE = 'MENU'
                 menu.enable()
 
         for event in events:
             if event.type == pygame.QUIT:
+                if GAME is not None:
+                    GAME.close()
                 pygame.quit()
                 sys.exit()
 
@@ -0,0 +1,148 @@
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+
+'''
+    NumPy inference of the value network: the weights of a Keras .h5 model
+    are exported once to a .npz, which NumpyModel runs batched in float32,
+    without TensorFlow. Only the layers of the deep_ai model are supported:
+    Conv2D (stride 1, 'same' or 'valid'), Flatten, Dense and Dropout.
+'''
+
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+H5_PATH = os.path.join(MODEL_DIR, 'model.h5')
+NPZ_PATH = os.path.join(MODEL_DIR, 'model.npz')
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+}
+
+
+def export_h5(h5_path=H5_PATH, npz_path=NPZ_PATH):
+    '''
+        Write the layers and weights of the Keras model `h5_path` to
+        `npz_path`. Needs h5py, not TensorFlow.
+    '''
+    import h5py
+
+    layers, arrays = [], {}
+    with h5py.File(h5_path, 'r') as file:
+        config = json.loads(file.attrs['model_config'])
+        weights = file['model_weights']
+        for layer in config['config']['layers']:
+            kind, layer_config = layer['class_name'], layer['config']
+            if kind in ('InputLayer', 'Dropout'): # dropout is the identity at inference
+                continue
+            if kind == 'Flatten':
+                layers.append({'kind': kind})
+                continue
+            if kind not in ('Conv2D', 'Dense'):
+                raise ValueError(f'Layer {kind} is not supported')
+            if kind == 'Conv2D' and tuple(layer_config.get('strides', (1, 1))) != (1, 1):
+                raise ValueError('Only Conv2D with stride 1 is supported')
+
+            name = layer_config['name']
+            group = weights[name][name]
+            index = len(layers)
+            arrays[f'kernel_{index}'] = np.asarray(group['kernel:0'], dtype=np.float32)
+            arrays[f'bias_{index}'] = np.asarray(group['bias:0'], dtype=np.float32)
+            layers.append({'kind': kind, 'activation': layer_config['activation'],
+                           'padding': layer_config.get('padding')})
+
+    np.savez(npz_path, layers=np.array(json.dumps(layers)), **arrays)
+
+
+class NumpyModel:
+    def __init__(self, layers, arrays):
+        self.layers = layers
+        self.arrays = arrays
+
+    @classmethod
+    def load(cls, npz_path=NPZ_PATH):
+        with np.load(npz_path) as file:
+            layers = json.loads(str(file['layers']))
+            arrays = {name: file[name] for name in file.files if name != 'layers'}
+        return cls(layers, arrays)
+
+    def _conv2d(self, x, kernel, padding):
+        kernel_h, kernel_w = kernel.shape[:2]
+        if padding == 'same':
+            # as TensorFlow: the extra row/column of an even kernel goes after
+            pad_h, pad_w = kernel_h - 1, kernel_w - 1
+            x = np.pad(x, ((0, 0), (pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+        height, width = x.shape[1] - kernel_h + 1, x.shape[2] - kernel_w + 1
+        out = np.zeros((x.shape[0], height, width, kernel.shape[3]), dtype=np.float32)
+        for dy in range(kernel_h):
+            for dx in range(kernel_w):
+                out += x[:, dy:dy + height, dx:dx + width, :] @ kernel[dy, dx]
+        return out
+
+    def predict_on_batch(self, x):
+        '''
+            Input
+            ----------
+                x: (N, 5, 5, 4) batch, as given to the Keras model.
+            Output
+            ----------
+                (N, 1) float32 outputs.
+        '''
+        x = np.asarray(x, dtype=np.float32)
+        for index, layer in enumerate(self.layers):
+            if layer['kind'] == 'Flatten':
+                x = x.reshape(len(x), -1)
+                continue
+            kernel, bias = self.arrays[f'kernel_{index}'], self.arrays[f'bias_{index}']
+            if layer['kind'] == 'Conv2D':
+                x = self._conv2d(x, kernel, layer['padding'])
+            else:
+                x = x @ kernel
+            x = ACTIVATIONS[layer['activation']](x + bias)
+        return x
+
+    __call__ = predict_on_batch
+
+
+def load_model(backend='numpy'):
+    '''
+        Value network of deep_ai.
+        backend: 'numpy' (model.npz) or 'tensorflow' (model.h5, needs TensorFlow).
+    '''
+    if backend == 'numpy':
+        if not os.path.exists(NPZ_PATH):
+            export_h5()
+        return NumpyModel.load()
+    if backend == 'tensorflow':
+        from tensorflow.keras.models import load_model as load_keras_model
+        return load_keras_model(H5_PATH, compile=False)
+    raise ValueError(f'Unknown backend {backend}')
+
+
+if __name__ == '__main__':
+    import time
+    import tempfile
+
+    # fresh export of model.h5, the tracked model.npz is left as it is
+    with tempfile.TemporaryDirectory() as path:
+        export_h5(npz_path=os.path.join(path, 'model.npz'))
+        model = NumpyModel.load(os.path.join(path, 'model.npz'))
+    x = np.random.default_rng(45).integers(0, 2, (1024, 5, 5, 4)).astype(np.float32)
+    start = time.time()
+    y = model.predict_on_batch(x)
+    print(f'numpy: {len(x) / (time.time() - start):9.0f} boards/s')
+
+    try:
+        keras_model = load_model('tensorflow')
+    except ImportError:
+        print('TensorFlow is not installed, outputs not compared')
+    else:
+        expected = np.asarray(keras_model.predict_on_batch(x))
+        print(f'max abs difference with TensorFlow: {np.abs(y - expected).max():.2e}')
+        assert np.allclose(y, expected, atol=1e-5)
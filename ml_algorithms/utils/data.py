@@ -1,18 +1,33 @@
-import sys, os, random, shutil
+import sys, os, random, shutil, json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from collections import deque
 
 from tqdm import tqdm
 import numpy as np
 import torch
 from torch.utils.data import Dataset
-from sklearn.model_selection import train_test_split
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from algorithms import State, Problem, epsilon
+from algorithms import State, Problem
+from algorithms import tt
+from ml_algorithms.utils import packed
+from ml_algorithms.utils.label_cache import LabelCache
 
 
 PROBLEM = Problem()
 
+SHARD_SIZE = 10000 # samples per shard of generate_shards
+MANIFEST = 'manifest.json'
+MAX_SKIPS = 20 # known positions drawn per sample before a shard gives up
+
+# canonical hashes of the positions already labeled, per generate_shards worker
+_known_positions = None
+
+# shared by every get_score call of a generation run, see algorithms/tt.py
+TT = tt.TranspositionTable()
+# exact values kept across runs, see set_label_cache
+LABEL_CACHE = None
+
 
 def get_random_board(depth_range=(5,95), get_state=False):
     '''
@@ -77,55 +92,58 @@ def get_score(pre_state: State, cur_state: State):
             score (int): score evaluated by epsilon with MAX_DEPTH
     '''
     MAX_DEPTH = 5
-    visited_states = {}
-
-    def _is_visited(state, depth):
-        return state in visited_states and \
-            visited_states[state][0] >= depth
-
-    def _add_visited_state(state, depth, score):
-        if state not in visited_states:
-            visited_states[state] = [depth,score]
-        elif visited_states[state][0] < depth:
-            visited_states[state][0] = depth
-            visited_states[state][1] = score
+    TT.new_search()
 
     def _calculate_score(state: State):
         return np.sum(state.board)
-        
-    def _minimax(pre_state, cur_state, depth, alpha, beta):
+
+    def _minimax(last_action, cur_state, depth, alpha, beta):
         if cur_state.check_winning_state() != 0:
             return 16*cur_state.check_winning_state()
 
         if(depth == 0):
             return _calculate_score(cur_state)
 
+        hint_move = None
+        entry = TT.probe(cur_state.key)
+        if entry is not None:
+            score = tt.get_cutoff(entry, depth, alpha, beta)
+            if score is not None:
+                return score
+            hint_move = entry[tt.MOVE]
+        if LABEL_CACHE is not None:
+            score = LABEL_CACHE.probe(cur_state.key, depth)
+            if score is not None:
+                return score
+        alpha_orig, beta_orig = alpha, beta
+
         # Get all possible actions
-        dict_possible_moves = PROBLEM.get_possible_moves(pre_state, cur_state)
+        dict_possible_moves = PROBLEM.get_possible_moves_after(cur_state, last_action)
 
         # Get all possible state and their info (move to get, score)
         next_states_info = []
         for start, possible_ends in dict_possible_moves.items():
             for end in possible_ends:
-                next_state = PROBLEM.move(cur_state, (start, end))
-                score = _calculate_score(next_state)
-                next_states_info.append((score,next_state))
+                record = PROBLEM.make_move(cur_state, (start, end))
+                score = _calculate_score(cur_state)
+                next_states_info.append((score,(start, end)))
+                PROBLEM.unmake_move(cur_state, record)
 
         best_score  = 0
+        best_move = None
 
         if(cur_state.player == 1):
-            next_states_info.sort(key=lambda x: x[0], reverse=True) # sort by score
+            next_states_info.sort(key=lambda x: (x[1] == hint_move, x[0]), reverse=True) # hint first, then by score
 
             best_score = -16
-            for _, next_state in next_states_info:
-                if(_is_visited(next_state, depth-1)):
-                    value = visited_states[next_state][1]
-                else:
-                    value = _minimax(cur_state, next_state, depth-1, alpha, beta)
-                    _add_visited_state(next_state, depth-1, value)
+            for _, next_move in next_states_info:
+                record = PROBLEM.make_move(cur_state, next_move)
+                value = _minimax(next_move, cur_state, depth-1, alpha, beta)
+                PROBLEM.unmake_move(cur_state, record)
 
                 if value > best_score:
                     best_score = value
+                    best_move = next_move
                     
                 if alpha < best_score:
                     alpha = best_score
@@ -133,27 +151,33 @@ def get_score(pre_state: State, cur_state: State):
                 if(beta <= alpha): break
             
         else:
-            next_states_info.sort(key=lambda x: x[0], reverse=False) # sort by score
+            next_states_info.sort(key=lambda x: (x[1] != hint_move, x[0]), reverse=False) # hint first, then by score
 
             best_score = 16
-            for _, next_state in next_states_info:
-                if(_is_visited(next_state, depth-1)):
-                    value = visited_states[next_state][1]
-                else:
-                    value = _minimax(cur_state, next_state, depth-1, alpha, beta)
-                    _add_visited_state(next_state, depth-1, value)
+            for _, next_move in next_states_info:
+                record = PROBLEM.make_move(cur_state, next_move)
+                value = _minimax(next_move, cur_state, depth-1, alpha, beta)
+                PROBLEM.unmake_move(cur_state, record)
 
                 if value < best_score:
                     best_score = value
+                    best_move = next_move
 
                 if beta > best_score:
                     beta = best_score
 
                 if(beta <= alpha): break
 
+        flag = tt.get_flag(best_score, alpha_orig, beta_orig)
+        TT.store(cur_state.key, depth, best_score, flag, best_move)
+        if flag == tt.EXACT and LABEL_CACHE is not None:
+            LABEL_CACHE.store(cur_state.key, depth, best_score)
         return best_score
 
-    return _minimax(pre_state, cur_state, MAX_DEPTH, -16, 16)
+    cur_state = cur_state.copy()
+    open_move = PROBLEM.get_open_move(pre_state, cur_state)
+    PROBLEM.set_open_move(cur_state, open_move)
+    return _minimax(open_move, cur_state, MAX_DEPTH, -16, 16)
 
 
 def generate_dataset(path, sample_num, depth_range=(5,95), random_state=45):
@@ -190,6 +214,211 @@ def generate_dataset(path, sample_num, depth_range=(5,95), random_state=45):
     np.save(os.path.join(path,'scores.npy'), scores)
 
 
+def _shard_name(index):
+    return f'shard_{index:05d}'
+
+
+def set_label_cache(path):
+    '''
+        Use (and fill) the label cache of ml_algorithms/utils/label_cache.py
+        at `path` in get_score, None to stop.
+    '''
+    global LABEL_CACHE
+    if LABEL_CACHE is not None:
+        LABEL_CACHE.close()
+    LABEL_CACHE = LabelCache(path) if path is not None else None
+
+
+def _init_worker(index, cache_path):
+    global _known_positions
+    _known_positions = index
+    set_label_cache(cache_path)
+
+
+def _generate_shard(path, index, sample_num, depth_range, seed):
+    # one shard (seed: its SeedSequence), written to a temporary folder renamed when complete
+    random_seed, numpy_seed = seed.generate_state(2).tolist()
+    random.seed(random_seed)
+    np.random.seed(numpy_seed)
+    TT.clear() # without a label cache, labels do not depend on the shards this worker did before
+
+    pre_boards = np.zeros((sample_num, 5, 5), dtype=np.int8)
+    cur_boards = np.zeros((sample_num, 5, 5), dtype=np.int8)
+    players = np.zeros(sample_num, dtype=np.int8)
+    scores = np.zeros(sample_num, dtype=np.float32)
+    seen, skipped, i = set(), 0, 0
+    while i < sample_num:
+        _, pre_state, cur_state = get_random_board(depth_range, get_state=True)
+        if _known_positions is not None:
+            # a position (or a symmetric one) labeled before is not searched again
+            record = packed.encode_boards(pre_state.board[None], cur_state.board[None], [cur_state.player], [0])
+            key = packed.canonical_hashes(record)[0]
+            if key in seen or _known_positions.contains([key])[0]:
+                skipped += 1
+                if skipped >= MAX_SKIPS*sample_num: # few new positions left in depth_range
+                    break
+                continue
+            seen.add(key)
+        pre_boards[i], cur_boards[i], players[i] = pre_state.board, cur_state.board, cur_state.player
+        scores[i] = (get_score(pre_state, cur_state)+16)/32
+        i += 1
+    pre_boards, cur_boards, players, scores = pre_boards[:i], cur_boards[:i], players[:i], scores[:i]
+    records = packed.encode_boards(pre_boards, cur_boards, players, scores)
+
+    shard_path = os.path.join(path, _shard_name(index))
+    temporary_path = shard_path + '.tmp'
+    if os.path.exists(temporary_path):
+        shutil.rmtree(temporary_path)
+    os.makedirs(temporary_path)
+    np.save(os.path.join(temporary_path,packed.POSITIONS_FILE), records)
+    os.replace(temporary_path, shard_path)
+    if LABEL_CACHE is not None:
+        LABEL_CACHE.flush()
+    return _shard_record(index, len(records), seed, skipped)
+
+
+def _shard_record(index, sample_num, seed, skipped=None):
+    # manifest entry, the seed is SeedSequence(entropy, spawn_key=spawn_key)
+    return {'path': _shard_name(index), 'sample_num': sample_num, 'skipped': skipped,
+            'seed': {'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key)}}
+
+
+def generate_shards(path, sample_num, shard_size=SHARD_SIZE, num_workers=None,
+                    depth_range=(5,95), random_state=45, resume=True, dedup=True, known_paths=None,
+                    cache_path=None):
+    '''
+        Generate `sample_num` samples as generate_dataset, in the packed
+        format of ml_algorithms/utils/packed.py and in shards of
+        `shard_size` samples generated in parallel by `num_workers`
+        processes (default: cpu count), and list them in a manifest:
+
+            path/
+            ├── manifest.json
+            ├── shard_00000/
+            │   └── positions.npy
+            └── shard_00001/
+                └── positions.npy
+
+        Shard i is seeded from SeedSequence(random_state).spawn(...)[i],
+        so without cache_path the data does not depend on num_workers, and a worker only
+        holds the shard it generates. With resume, the complete shards
+        of an interrupted run with the same settings (dedup, known_paths
+        and cache_path included) are kept.
+
+        dedup: a position equal, up to a symmetry, to one of known_paths
+        (datasets already labeled, see find_shards, eg. ['ds/']), to one of
+        the complete shards of a resumed run or to one before in its shard
+        is not labeled. Shards generated at the same time cannot see each
+        other: once all are done, a position of several shards is kept in
+        the first one only (see the 'duplicates' of the manifest). Shards
+        can then be short. The index of the run's positions is saved to
+        path/index.npy, read back by load_index.
+
+        cache_path: label cache (SQLite file) read and filled by the
+        workers, eg. 'ds/labels.sqlite': a run over positions labeled by an
+        earlier run mostly reads their values. The labels are then not
+        reproducible: a node takes the exact value of a deeper search if
+        the cache has one, which depends on what the other workers and the
+        earlier runs stored. Leave it None for reproducible labels.
+    '''
+    num_shards = (sample_num + shard_size - 1) // shard_size
+    seeds = np.random.SeedSequence(random_state).spawn(num_shards)
+    # what the shards depend on, a resumed run must have the same
+    settings = {'sample_num': sample_num, 'shard_size': shard_size,
+                'depth_range': list(depth_range), 'random_state': random_state,
+                'dedup': dedup, 'known_paths': list(known_paths or []), 'cache_path': cache_path}
+
+    manifest_path = os.path.join(path, MANIFEST)
+    same_settings, old_shards = False, []
+    if resume and os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            old_manifest = json.load(file)
+        same_settings = {key: old_manifest.get(key) for key in settings} == settings
+        old_shards = old_manifest.get('shards', [])
+    if os.path.exists(path) and not same_settings:
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+
+    manifest = dict(settings, format='positions.npy, see ml_algorithms/utils/packed.py', shards=[None]*num_shards)
+    def _write_manifest():
+        with open(manifest_path + '.tmp', 'w') as file:
+            json.dump(manifest, file, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    pending = []
+    for index in range(num_shards):
+        size = min(shard_size, sample_num - index*shard_size)
+        if os.path.exists(os.path.join(path, _shard_name(index), packed.POSITIONS_FILE)):
+            if index < len(old_shards) and old_shards[index] is not None:
+                manifest['shards'][index] = old_shards[index] # keeps its skipped count
+            else:
+                records = np.load(os.path.join(path, _shard_name(index), packed.POSITIONS_FILE), mmap_mode='r')
+                manifest['shards'][index] = _shard_record(index, len(records), seeds[index])
+        else:
+            pending.append((index, size))
+    _write_manifest()
+
+    known = packed.PositionIndex() if dedup else None
+    if dedup:
+        for known_path in known_paths or []:
+            known.add(load_index(known_path).hashes)
+        complete = [os.path.join(path, shard['path']) for shard in manifest['shards'] if shard is not None]
+        known.add(packed.PositionIndex.build(complete).hashes)
+
+    with ProcessPoolExecutor(num_workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(known, cache_path)) as pool, \
+            tqdm(total=sample_num, initial=sample_num - sum(size for _, size in pending)) as progress:
+        futures = {pool.submit(_generate_shard, path, index, size, depth_range, seeds[index]): index
+                   for index, size in pending}
+        size_of = dict(pending)
+        for future in as_completed(futures):
+            manifest['shards'][futures[future]] = future.result()
+            _write_manifest()
+            progress.update(size_of[futures[future]])
+
+    if dedup:
+        index = _drop_duplicates(path, manifest)
+        _write_manifest()
+    else:
+        index = packed.PositionIndex.build(find_shards(path))
+    index.save(os.path.join(path, packed.INDEX_FILE))
+    return manifest
+
+
+def _drop_duplicates(path, manifest):
+    # a position found by several shards of a run is kept in the first one,
+    # so the result only depends on the shards; returns the run's index
+    index = packed.PositionIndex()
+    for shard in manifest['shards']:
+        file_path = os.path.join(path, shard['path'], packed.POSITIONS_FILE)
+        records = np.load(file_path)
+        hashes = packed.canonical_hashes(records)
+        _, first = np.unique(hashes, return_index=True)
+        keep = np.zeros(len(records), dtype=bool)
+        keep[first] = True
+        keep &= ~index.contains(hashes)
+        if not keep.all():
+            np.save(file_path + '.tmp.npy', records[keep])
+            os.replace(file_path + '.tmp.npy', file_path)
+            shard['sample_num'] = int(keep.sum())
+            shard['duplicates'] = shard.get('duplicates', 0) + int((~keep).sum())
+        index.add(hashes[keep])
+    return index
+
+
+def load_index(root_path):
+    '''
+        PositionIndex of the shards of root_path (see find_shards, packed or
+        not), from its index.npy if generate_shards wrote one.
+    '''
+    if isinstance(root_path, str) and os.path.exists(os.path.join(root_path, packed.INDEX_FILE)):
+        return packed.PositionIndex.load(os.path.join(root_path, packed.INDEX_FILE))
+    shard_paths = find_shards(root_path)
+    if not shard_paths:
+        raise FileNotFoundError(f'No positions.npy or boards.npy/scores.npy under {root_path}')
+    return packed.PositionIndex.build(shard_paths)
+
+
 def analyze_state(max_depth=5):
     '''
         Use this funtion have a glance view on all possible state 
@@ -227,6 +456,31 @@ def analyze_state(max_depth=5):
     return True
 
 
+def find_shards(root_path):
+    '''
+        Folders holding samples under `root_path` (positions.npy, or a
+        boards.npy/scores.npy pair): the shards of its manifest.json if any,
+        root_path itself if it holds samples, else its sub folders that do
+        (eg. every ds/*/).
+    '''
+    if isinstance(root_path, (list, tuple)):
+        return [shard for path in root_path for shard in find_shards(path)]
+
+    manifest_path = os.path.join(root_path, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        return [os.path.join(root_path, shard['path']) for shard in manifest['shards'] if shard is not None]
+    def _has_samples(path):
+        return os.path.exists(os.path.join(path, packed.POSITIONS_FILE)) \
+            or os.path.exists(os.path.join(path, 'scores.npy'))
+
+    if _has_samples(root_path):
+        return [root_path]
+    return [os.path.join(root_path, name) for name in sorted(os.listdir(root_path))
+            if not name.endswith('.tmp') and _has_samples(os.path.join(root_path, name))]
+
+
 class BoardDataset(Dataset):
     ''' How to use dataloader
 
@@ -245,27 +499,117 @@ class BoardDataset(Dataset):
             shuffle=True
         )
 
+        data_path: a folder of shards (eg. 'ds/', every shard is loaded,
+        packed positions.npy or boards.npy/scores.npy), a
+        generate_shards folder (its manifest), one shard, or a list of them.
+        The arrays are memory mapped, not read: DataLoader workers share
+        the pages of the files. The split is a seeded permutation of the
+        sample indices, the same for train and test.
+        augment: each sample is returned under a random one of the 8
+        symmetries of the board (same label), see packed.SYMMETRIES.
     '''
-    def __init__(self, root_path, train=True, test_size=0.1, random_state=45):
-        boards = np.load(os.path.join(data_path,'boards.npy'))
-        scores = np.load(os.path.join(data_path,'scores.npy'))
-
-        boards_train, boards_test, scores_train, scores_test = train_test_split(
-            boards, scores, test_size=test_size, random_state=random_state)
-        
-        self.boards = boards_train if train else boards_test
-        self.scores = scores_train if train else scores_test
+    def __init__(self, root_path, train=True, test_size=0.1, random_state=45, augment=False):
+        self.augment = augment
+        self.shard_paths = find_shards(root_path)
+        if not self.shard_paths:
+            raise FileNotFoundError(f'No boards.npy/scores.npy under {root_path}')
+        # a shard is packed records (decoded by batch), or boards and scores
+        self.shard_records, self.shard_boards, self.shard_scores = [], [], []
+        for path in self.shard_paths:
+            if os.path.exists(os.path.join(path, packed.POSITIONS_FILE)):
+                self.shard_records.append(np.load(os.path.join(path, packed.POSITIONS_FILE), mmap_mode='r'))
+                self.shard_boards.append(None)
+                self.shard_scores.append(None)
+            else:
+                self.shard_records.append(None)
+                self.shard_boards.append(np.load(os.path.join(path,'boards.npy'), mmap_mode='r'))
+                self.shard_scores.append(np.load(os.path.join(path,'scores.npy'), mmap_mode='r'))
+        # offsets[i]: index of the first sample of shard i
+        self.offsets = np.cumsum([0] + [len(records if records is not None else scores)
+                                        for records, scores in zip(self.shard_records, self.shard_scores)])
+
+        # as train_test_split: ceil(test_size * n) test samples
+        permutation = np.random.default_rng(random_state).permutation(self.offsets[-1])
+        test_num = int(np.ceil(test_size * self.offsets[-1]))
+        # sorted, so a batch reads the files mostly forward
+        self.indices = np.sort(permutation[test_num:] if train else permutation[:test_num])
 
     def __len__(self):
-        return self.boards.shape[0]
+        return len(self.indices)
+
+    def _gather(self, indices):
+        # boards (N,4,5,5) and scores (N,) float32 of dataset indices, one
+        # fancy index read per shard
+        samples = self.indices[np.asarray(indices)]
+        shard_ids = np.searchsorted(self.offsets, samples, side='right') - 1
+        boards = np.empty((len(samples), 4, 5, 5), dtype=np.float32)
+        scores = np.empty(len(samples), dtype=np.float32)
+        for shard_id in np.unique(shard_ids):
+            rows = np.flatnonzero(shard_ids == shard_id)
+            local = samples[rows] - self.offsets[shard_id]
+            if self.shard_records[shard_id] is not None:
+                records = self.shard_records[shard_id][local]
+                boards[rows] = packed.decode_planes(records)
+                scores[rows] = records['score']
+            else:
+                boards[rows] = self.shard_boards[shard_id][local]
+                scores[rows] = self.shard_scores[shard_id][local]
+        if self.augment:
+            # torch's generator, seeded per DataLoader worker (numpy's is not)
+            symmetries = torch.randint(len(packed.SYMMETRIES), (len(samples),)).numpy()
+            boards = packed.transform_planes(boards, symmetries)
+        return boards, scores
 
     def __getitem__(self, index):
-        board = torch.as_tensor(self.boards[index],dtype=torch.float32)
-        score = torch.as_tensor(self.scores[index],dtype=torch.float32)
+        boards, scores = self._gather([index])
+        return torch.from_numpy(boards[0]), torch.from_numpy(scores)[0]
 
-        return board, score
+    def __getitems__(self, indices):
+        # batched fetch of DataLoader (torch >= 2.0): one read for the batch
+        boards, scores = self._gather(indices)
+        return list(zip(torch.from_numpy(boards), torch.from_numpy(scores)))
+
+
+def check_dedup(depth_range=(5,30), sample_num=12):
+    '''
+        A position of a generated shard with O to move, stored as a legacy
+        sample (planes of the side to move) and converted or not, must be
+        skipped when its shard is generated again against that dataset.
+    '''
+    import tempfile
+    global _known_positions
+
+    seed = np.random.SeedSequence(45)
+    with tempfile.TemporaryDirectory() as path:
+        _known_positions = None
+        _generate_shard(path, 0, sample_num, depth_range, seed)
+        records = np.load(os.path.join(path, _shard_name(0), packed.POSITIONS_FILE))
+        o_to_move = records[records['side'] == -1][:1]
+        assert len(o_to_move), 'no position with O to move, use more samples'
+
+        for convert in (False, True):
+            legacy_path = os.path.join(path, 'legacy')
+            os.makedirs(legacy_path, exist_ok=True)
+            np.save(os.path.join(legacy_path, 'boards.npy'), packed.decode_planes(o_to_move))
+            np.save(os.path.join(legacy_path, 'scores.npy'), o_to_move['score'].astype(np.float32))
+            if convert:
+                packed.convert_folder(legacy_path, remove=True)
+
+            _known_positions = load_index(legacy_path)
+            try:
+                shard = _generate_shard(path, 1, sample_num, depth_range, seed)
+            finally:
+                _known_positions = None
+            regenerated = np.load(os.path.join(path, _shard_name(1), packed.POSITIONS_FILE))
+            assert shard['skipped'] >= 1, shard
+            assert not np.isin(packed.canonical_hashes(regenerated), packed.canonical_hashes(o_to_move)).any()
+            shutil.rmtree(legacy_path)
+            shutil.rmtree(os.path.join(path, _shard_name(1)))
+    print('positions with O to move are skipped against legacy and converted samples')
 
 
 if __name__ == '__main__':
     data_path = 'ds/1000/'
-    # generate_dataset(data_path, 1000)
\ No newline at end of file
+    # generate_dataset(data_path, 1000)
+    # generate_shards('ds/shards/', 1000000)
+    check_dedup()
@@ -0,0 +1,95 @@
+import os, sqlite3
+
+
+'''
+    Disk cache of the search values behind the labels of data.get_score,
+    kept across generation runs: a SQLite table key -> (depth, score), the
+    key being the Zobrist key of the position (board, player and open
+    point, see algorithms/problem.py).
+
+    Only exact values are stored (bounds depend on the window of the search
+    that found them), and only for nodes searched MIN_DEPTH plies or more:
+    the shallow nodes are most of the tree and cheaper to search again than
+    to look up. Writes are buffered and committed by FLUSH_SIZE entries.
+    The database is in WAL mode, the workers of generate_shards each open
+    it and read while one of them writes. Like the transposition table, a
+    probe returns the values of deeper searches too, so the labels found
+    with a cache depend on its contents.
+'''
+
+
+MIN_DEPTH = 2
+FLUSH_SIZE = 10000
+TIMEOUT = 60 # (s) wait for the write lock of another worker
+
+
+def _signed(key):
+    # SQLite integers are signed 64-bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class LabelCache:
+    def __init__(self, path, min_depth=MIN_DEPTH):
+        '''
+            path: SQLite file, created if it does not exist.
+        '''
+        self.path = path
+        self.min_depth = min_depth
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=TIMEOUT)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS scores '
+                                    '(key INTEGER PRIMARY KEY, depth INTEGER NOT NULL, score INTEGER NOT NULL)')
+        self.pending = {} # key -> (depth, score) not written yet
+
+        self.probes = 0
+        self.hits = 0
+
+    def __reduce__(self):
+        # a process opens its own connection to the file
+        return (LabelCache, (self.path, self.min_depth))
+
+    def probe(self, key, depth):
+        '''Exact score of `key` searched to `depth` or deeper, None if not stored.'''
+        if depth < self.min_depth:
+            return None
+        self.probes += 1
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.connection.execute('SELECT depth, score FROM scores WHERE key = ?',
+                                            (_signed(key),)).fetchone()
+        if entry is None or entry[0] < depth:
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def store(self, key, depth, score):
+        '''Store the exact score of a node searched to `depth`, a deeper one is kept.'''
+        if depth < self.min_depth:
+            return
+        current = self.pending.get(key)
+        if current is None or current[0] < depth:
+            self.pending[key] = (depth, int(score))
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO scores VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE '
+                'SET depth = excluded.depth, score = excluded.score WHERE excluded.depth > scores.depth',
+                [(_signed(key), depth, score) for key, (depth, score) in self.pending.items()])
+        self.pending.clear()
+
+    def __len__(self):
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,257 @@
+import sys, os, argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+'''
+    Packed training positions: one 19-byte record per sample instead of a
+    (4,5,5) float array (800 bytes in float64).
+
+        cur, prev: uint64, bit (y*5 + x) for the X(1) pieces, bit 25 + (y*5 + x)
+                   for the O(-1) pieces, as the masks of algorithms/bitboard.py
+        side:      int8, player to move in cur
+        score:     float16, label in [0, 1] ((s+16)/32 is exact in float16)
+
+    decode_planes expands a batch back to the 4 planes of get_random_board.
+
+    The 8 symmetries of the square (rotations and reflections) keep the
+    diagonal pattern of the board (points with y+x even) and so the rules
+    and the label: canonical_hashes gives one hash per class of symmetric
+    positions, PositionIndex holds the hashes of labeled positions. The
+    hashes see the position from the side to move (its pieces as X), as
+    encode_planes stores it, so a converted sample and the same position
+    generated with O to move have the same hash.
+'''
+
+
+SIZE = 25
+POSITION_DTYPE = np.dtype([('cur', '<u8'), ('prev', '<u8'), ('side', 'i1'), ('score', '<f2')])
+POSITIONS_FILE = 'positions.npy'
+
+_BITS = np.arange(SIZE, dtype=np.uint64)
+_FULL = np.uint64((1 << SIZE) - 1)
+
+# SYMMETRIES[k][j]: point moved to point j by symmetry k (0 is the identity)
+_GRID = np.arange(SIZE).reshape(5, 5)
+SYMMETRIES = np.array([np.rot90(grid, turns).ravel() for grid in (_GRID, _GRID.T) for turns in range(4)])
+INDEX_FILE = 'index.npy'
+
+
+def _masks(boards, value):
+    # (N,25) bool -> (N,) uint64 with bit i set where boards[:, i] == value
+    return ((np.asarray(boards).reshape(len(boards), SIZE) == value).astype(np.uint64) << _BITS).sum(axis=1, dtype=np.uint64)
+
+
+def encode_boards(pre_boards, cur_boards, players, scores):
+    '''
+        Input
+        ----------
+            pre_boards, cur_boards: (N,5,5) boards with 1, -1 and 0.
+            players: (N,) player to move in cur_boards.
+            scores: (N,) labels.
+        Output
+        ----------
+            (N,) POSITION_DTYPE records.
+    '''
+    records = np.zeros(len(cur_boards), dtype=POSITION_DTYPE)
+    records['cur'] = _masks(cur_boards, 1) | (_masks(cur_boards, -1) << np.uint64(SIZE))
+    records['prev'] = _masks(pre_boards, 1) | (_masks(pre_boards, -1) << np.uint64(SIZE))
+    records['side'] = players
+    records['score'] = scores
+    return records
+
+
+def encode_planes(planes, scores):
+    '''
+        Records of (N,4,5,5) planes of get_random_board. The planes are from
+        the side to move, which they do not record: the positions are
+        stored with X to move, they decode to the same planes.
+    '''
+    planes = np.asarray(planes)
+    cur_boards = planes[:, 1] - planes[:, 0] # own pieces are X
+    pre_boards = planes[:, 3] - planes[:, 2]
+    return encode_boards(pre_boards, cur_boards, np.ones(len(planes), dtype=np.int8), scores)
+
+
+def decode_planes(records, dtype=np.float32):
+    '''
+        (N,4,5,5) planes of `records`, as get_random_board:
+            channel 0: opponent's pieces in cur_board
+            channel 1: pieces of the player to move in cur_board
+            channel 2: opponent's pieces in pre_board
+            channel 3: pieces of the player to move in pre_board
+    '''
+    x_to_move = (records['side'] != -1)[:, None]
+    planes = np.empty((len(records), 4, SIZE), dtype=dtype)
+    for channel, field in ((0, 'cur'), (2, 'prev')):
+        masks = records[field]
+        x_pieces = masks & _FULL
+        o_pieces = (masks >> np.uint64(SIZE)) & _FULL
+        own = np.where(x_to_move[:, 0], x_pieces, o_pieces)
+        opponent = np.where(x_to_move[:, 0], o_pieces, x_pieces)
+        planes[:, channel] = (opponent[:, None] >> _BITS) & np.uint64(1)
+        planes[:, channel + 1] = (own[:, None] >> _BITS) & np.uint64(1)
+    return planes.reshape(len(records), 4, 5, 5)
+
+
+def _bits(masks):
+    # (N,) uint64 -> (N,25) uint8
+    return ((masks[:, None] >> _BITS) & np.uint64(1)).astype(np.uint8)
+
+
+def _pack_bits(bits):
+    return (bits.astype(np.uint64) << _BITS).sum(axis=1, dtype=np.uint64)
+
+
+def transform_records(records, symmetry):
+    '''Records of `records` mapped by SYMMETRIES[symmetry], same side and score.'''
+    source = SYMMETRIES[symmetry]
+    transformed = records.copy()
+    for field in ('cur', 'prev'):
+        x_pieces = _pack_bits(_bits(records[field] & _FULL)[:, source])
+        o_pieces = _pack_bits(_bits((records[field] >> np.uint64(SIZE)) & _FULL)[:, source])
+        transformed[field] = x_pieces | (o_pieces << np.uint64(SIZE))
+    return transformed
+
+
+def transform_planes(planes, symmetries):
+    '''(N,C,5,5) planes, sample n mapped by SYMMETRIES[symmetries[n]].'''
+    flat = planes.reshape(len(planes), planes.shape[1], SIZE)
+    source = SYMMETRIES[np.asarray(symmetries)][:, None, :]
+    return np.take_along_axis(flat, np.broadcast_to(source, flat.shape), axis=2).reshape(planes.shape)
+
+
+def _mix(values):
+    # splitmix64 finalizer, uint64 arithmetic wraps
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+def _swap_colors(masks):
+    return ((masks & _FULL) << np.uint64(SIZE)) | ((masks >> np.uint64(SIZE)) & _FULL)
+
+
+def position_hashes(records):
+    '''(N,) uint64 hash of cur and prev, from the side to move.'''
+    o_to_move = records['side'] == -1
+    cur = np.where(o_to_move, _swap_colors(records['cur']), records['cur'])
+    prev = np.where(o_to_move, _swap_colors(records['prev']), records['prev'])
+    return _mix(_mix(cur) ^ prev)
+
+
+def canonical_hashes(records):
+    '''(N,) uint64, the same for the 8 symmetric forms of a position.'''
+    return np.min([position_hashes(transform_records(records, k)) for k in range(len(SYMMETRIES))], axis=0)
+
+
+def _read_records(path, chunk_size):
+    # chunks of records of a shard folder, packed or not
+    if os.path.exists(os.path.join(path, POSITIONS_FILE)):
+        records = np.load(os.path.join(path, POSITIONS_FILE), mmap_mode='r')
+        for begin in range(0, len(records), chunk_size):
+            yield np.asarray(records[begin:begin + chunk_size])
+    elif os.path.exists(os.path.join(path, 'boards.npy')):
+        planes = np.load(os.path.join(path, 'boards.npy'), mmap_mode='r')
+        scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+        for begin in range(0, len(planes), chunk_size):
+            yield encode_planes(planes[begin:begin + chunk_size], scores[begin:begin + chunk_size])
+    else:
+        raise FileNotFoundError(f'No {POSITIONS_FILE} or boards.npy/scores.npy in {path}')
+
+
+class PositionIndex:
+    def __init__(self, hashes=()):
+        '''
+            Set of canonical hashes, a sorted uint64 array (8 bytes a position).
+        '''
+        self.hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+
+    @classmethod
+    def build(cls, shard_paths, chunk_size=1 << 18):
+        '''
+            Index of the shards of shard_paths, read by chunks: packed
+            (positions.npy), or boards.npy/scores.npy encoded on the fly.
+        '''
+        hashes = []
+        for path in shard_paths:
+            for records in _read_records(path, chunk_size):
+                hashes.append(canonical_hashes(records))
+        return cls(np.concatenate(hashes) if hashes else ())
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        index.hashes = np.load(path)
+        return index
+
+    def save(self, path):
+        np.save(path, self.hashes)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def contains(self, hashes):
+        '''(N,) bool, hashes[n] is in the index.'''
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), max(len(self.hashes) - 1, 0))
+        return (self.hashes[positions] == hashes) if len(self.hashes) else np.zeros(len(hashes), dtype=bool)
+
+    def add(self, hashes):
+        self.hashes = np.union1d(self.hashes, np.asarray(hashes, dtype=np.uint64))
+
+    def duplicates(self, records):
+        '''(N,) bool, records[n] is in the index or repeats an earlier record.'''
+        hashes = canonical_hashes(records)
+        _, first = np.unique(hashes, return_index=True)
+        repeated = np.ones(len(records), dtype=bool)
+        repeated[first] = False
+        return repeated | self.contains(hashes)
+
+
+def convert_folder(path, remove=False):
+    '''
+        Write path/positions.npy from path/boards.npy and path/scores.npy,
+        checked to decode to the same planes. remove: then delete the two
+        original files.
+
+        Output
+        ----------
+            (bytes before, bytes after)
+    '''
+    boards_path, scores_path = os.path.join(path, 'boards.npy'), os.path.join(path, 'scores.npy')
+    planes = np.load(boards_path, mmap_mode='r')
+    scores = np.load(scores_path, mmap_mode='r')
+    records = encode_planes(planes, scores)
+    if not np.array_equal(decode_planes(records), planes) \
+            or not np.array_equal(records['score'].astype(scores.dtype), scores):
+        raise ValueError(f'{path} does not round trip through the packed format')
+
+    before = os.path.getsize(boards_path) + os.path.getsize(scores_path)
+    np.save(os.path.join(path, POSITIONS_FILE + '.tmp.npy'), records)
+    os.replace(os.path.join(path, POSITIONS_FILE + '.tmp.npy'), os.path.join(path, POSITIONS_FILE))
+    if remove:
+        os.remove(boards_path)
+        os.remove(scores_path)
+    return before, os.path.getsize(os.path.join(path, POSITIONS_FILE))
+
+
+if __name__ == '__main__':
+    from data import find_shards
+
+    parser = argparse.ArgumentParser(description='Convert boards.npy/scores.npy shards to the packed format.')
+    parser.add_argument('root', nargs='?', default='ds', help='folder of shards, eg. ds (every ds/Session *)')
+    parser.add_argument('--remove', action='store_true', help='delete boards.npy/scores.npy once converted')
+    args = parser.parse_args()
+
+    total_before = total_after = 0
+    for path in find_shards(args.root):
+        if not os.path.exists(os.path.join(path, 'boards.npy')):
+            continue
+        before, after = convert_folder(path, args.remove)
+        total_before, total_after = total_before + before, total_after + after
+        print(f'{path}: {before/1024:8.1f}KB -> {after/1024:6.1f}KB')
+    if total_after:
+        print(f'total: {total_before/1024:.1f}KB -> {total_after/1024:.1f}KB ({total_before/total_after:.0f}x)')
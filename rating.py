@@ -0,0 +1,189 @@
+import sys
+import math
+import argparse
+
+import numpy as np
+
+
+'''
+    Ratings from game records (the JSON lines of arena.py): Elo fitted by
+    maximum likelihood, with confidence intervals from the curvature of the
+    likelihood, and a sequential probability ratio test (SPRT) deciding a
+    head-to-head match as soon as possible.
+
+        python rating.py arena.jsonl
+        python rating.py arena.jsonl --sprt 0 10 --bots epsilon alpha
+'''
+
+
+ELO_SCALE = 400 / math.log(10) # Elo points per unit of logit
+PRIOR_DRAWS = 2 # virtual draws per pairing, as BayesElo; keeps perfect scores finite
+Z_95 = 1.959964
+SPRT_PRIOR = 0.5 # games of each outcome added to the variance of the SPRT
+
+
+def expected_score(elo_diff):
+    '''Expected score of a player rated elo_diff above its opponent.'''
+    return 1 / (1 + 10 ** (-elo_diff / 400))
+
+
+def _pairings(results):
+    # {(a, b): [score of a, games]} with a < b
+    pairings = {}
+    for result in results:
+        a, b = result['player1'], result['player2']
+        score = (result['winner'] + 1) / 2 # of player1
+        if a > b:
+            a, b, score = b, a, 1 - score
+        entry = pairings.setdefault((a, b), [0.0, 0])
+        entry[0] += score
+        entry[1] += 1
+    return pairings
+
+
+def fit_elo(results, anchor=None, prior_draws=PRIOR_DRAWS, iterations=100):
+    '''
+        Elo ratings maximizing the likelihood of the results, a draw is half
+        a win (Bradley-Terry on scores).
+
+        Input
+        ----------
+            results: game records with 'player1', 'player2' and 'winner'.
+            anchor: bot rated 0, the mean rating is 0 otherwise.
+            prior_draws: virtual draws added to each pairing played.
+
+        Output
+        ----------
+            {bot: (elo, error)}, error: half width of the 95% interval.
+    '''
+    pairings = _pairings(results)
+    names = sorted({name for pair in pairings for name in pair})
+    if not names:
+        return {}
+    index = {name: i for i, name in enumerate(names)}
+    first = np.array([index[a] for a, _ in pairings])
+    second = np.array([index[b] for _, b in pairings])
+    games = np.array([games for _, games in pairings.values()], dtype=float) + prior_draws
+    scores = np.array([score for score, _ in pairings.values()]) + prior_draws / 2
+
+    # Newton steps on the logit ratings, the Hessian is singular along the
+    # common shift, which the pseudo inverse leaves out (mean kept at 0)
+    ratings = np.zeros(len(names))
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(ratings[second] - ratings[first]))
+        gradient = np.zeros(len(names))
+        np.add.at(gradient, first, scores - games * p)
+        np.add.at(gradient, second, games * p - scores)
+        information = _information(len(names), first, second, games * p * (1 - p))
+        step = np.linalg.pinv(information) @ gradient
+        ratings += step
+        if np.abs(step).max() < 1e-10:
+            break
+
+    p = 1 / (1 + np.exp(ratings[second] - ratings[first]))
+    covariance = np.linalg.pinv(_information(len(names), first, second, games * p * (1 - p)))
+    if anchor is not None:
+        # ratings and errors relative to the anchor
+        if anchor not in index:
+            raise ValueError(f'Unknown anchor {anchor!r}, the bots of the results are {", ".join(names)}')
+        a = index[anchor]
+        ratings = ratings - ratings[a]
+        variances = np.diag(covariance) + covariance[a, a] - 2 * covariance[:, a]
+    else:
+        variances = np.diag(covariance)
+    errors = Z_95 * np.sqrt(np.maximum(variances, 0))
+    return {name: (float(ELO_SCALE * ratings[i]), float(ELO_SCALE * errors[i])) for i, name in enumerate(names)}
+
+
+def _information(num_players, first, second, weights):
+    # Fisher information (minus the Hessian of the log likelihood)
+    information = np.zeros((num_players, num_players))
+    np.add.at(information, (first, first), weights)
+    np.add.at(information, (second, second), weights)
+    np.add.at(information, (first, second), -weights)
+    np.add.at(information, (second, first), -weights)
+    return information
+
+
+def head_to_head(results, bot, opponent):
+    '''(wins, draws, losses) of bot against opponent.'''
+    wins = draws = losses = 0
+    for result in results:
+        if {result['player1'], result['player2']} != {bot, opponent} or bot == opponent:
+            continue
+        side = 1 if result['player1'] == bot else -1
+        if result['winner'] == 0:
+            draws += 1
+        elif result['winner'] == side:
+            wins += 1
+        else:
+            losses += 1
+    return wins, draws, losses
+
+
+def sprt(wins, draws, losses, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+    '''
+        Sequential probability ratio test of H0: elo = elo0 against
+        H1: elo = elo1, with the normal approximation of the log likelihood
+        ratio of the score (as used by the chess engine testing frameworks).
+
+        Output
+        ----------
+            {'llr', 'lower', 'upper', 'decision'}: decision is 'H1' (better
+            by elo1), 'H0' (not better than elo0) or None to keep playing.
+    '''
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    llr = 0.0
+    games = wins + draws + losses
+    if games:
+        score = (wins + draws / 2) / games
+        # variance of the score of one game, with half a game of each
+        # outcome added: a one-sided start (all wins) would have none and be
+        # decided at once
+        prior = [count + SPRT_PRIOR for count in (wins, draws, losses)]
+        prior_score = (prior[0] + prior[1] / 2) / sum(prior)
+        variance = (prior[0] + prior[1] / 4) / sum(prior) - prior_score ** 2
+        score0, score1 = expected_score(elo0), expected_score(elo1)
+        llr = games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+    decision = 'H1' if llr >= upper else 'H0' if llr <= lower else None
+    return {'llr': float(llr), 'lower': lower, 'upper': upper, 'decision': decision}
+
+
+def print_ratings(results, anchor=None):
+    ratings = fit_elo(list(results), anchor)
+    print(f'\n{"bot":12s} {"elo":>7s} {"95%":>7s}')
+    for name, (elo, error) in sorted(ratings.items(), key=lambda item: -item[1][0]):
+        print(f'{name:12s} {elo:7.1f} {error:7.1f}')
+
+
+def print_sprt(results, bot, opponent, elo0, elo1, alpha=0.05, beta=0.05):
+    wins, draws, losses = head_to_head(results, bot, opponent)
+    test = sprt(wins, draws, losses, elo0, elo1, alpha, beta)
+    decision = {'H1': f'{bot} is better (H1)', 'H0': f'{bot} is not better (H0)', None: 'undecided'}
+    print(f'SPRT {bot} vs {opponent} [{elo0}, {elo1}]: +{wins} ={draws} -{losses}, '
+          f'LLR {test["llr"]:.2f} ({test["lower"]:.2f}, {test["upper"]:.2f}), {decision[test["decision"]]}')
+    return test
+
+
+def main(argv=None):
+    from arena import load_results
+
+    parser = argparse.ArgumentParser(description='Elo ratings and SPRT from arena results.')
+    parser.add_argument('results', help='JSON lines file written by arena.py')
+    parser.add_argument('--anchor', help='bot rated 0')
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'))
+    parser.add_argument('--bots', nargs=2, metavar=('BOT', 'OPPONENT'), help='pair tested by --sprt')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    results = list(load_results(args.results).values())
+    print_ratings(results, args.anchor)
+    if args.sprt is not None:
+        if args.bots is None:
+            parser.error('--sprt needs --bots BOT OPPONENT')
+        print_sprt(results, *args.bots, *args.sprt, args.alpha, args.beta)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])